@@ -1,15 +1,23 @@
 import threading
 import time
 from datetime import datetime
-from data_simulation import data_simulation
+from data_simulation import data_simulation, request_shutdown
+from batch_engine import batch_simulation
+from supervisor import supervised_simulation
+from config import SIMULATION_MODE, SIMULATION_WORKERS
 from productionplan_importer import import_productionplan
 
 def main():
     print("Starting PPM Simulation Application")
     
+    simulation_thread = None
     try:
         # Start simulation in a separate thread
-        simulation_thread = threading.Thread(target=data_simulation, daemon=True)
+        if SIMULATION_WORKERS > 1:
+            target = supervised_simulation
+        else:
+            target = batch_simulation if SIMULATION_MODE == 'batch' else data_simulation
+        simulation_thread = threading.Thread(target=target, daemon=True)
         simulation_thread.start()
         print("Simulation thread started")
         
@@ -35,7 +43,18 @@ def main():
         print("Application stopped by user")
     except Exception as e:
         print(f"Fatal error: {str(e)}")
+        stop_simulation(simulation_thread)
         exit(1)
+    stop_simulation(simulation_thread)
+
+def stop_simulation(simulation_thread, timeout: float = 30.0):
+    """Let the daemon simulation thread leave its loop, so its sink is flushed and closed (Parquet footer)."""
+    if simulation_thread is None:
+        return
+    request_shutdown()
+    simulation_thread.join(timeout)
+    if simulation_thread.is_alive():
+        print("[WARN] Simulation thread did not stop in time; buffered output may be lost")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,94 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from config import EXCEL_FILE_PATH, DB_URL, MQTT_BATCH_ENABLED
+from data_simulation import DataSimulator, ProductionScheduler, create_output
+
+class VirtualClock:
+    """Simulation time over [start, ...) advancing speed times faster than real time (0: no waiting)."""
+
+    def __init__(self, start: datetime, speed: float = 0.0):
+        self.start = start
+        self.speed = speed
+        self.current = start
+        self._real_start = time.monotonic()
+
+    def now(self) -> datetime:
+        return self.current
+
+    def advance_to(self, target: datetime):
+        """Move the clock to target, sleeping first so it stays at speed x real time."""
+        if target <= self.current:
+            return
+        if self.speed > 0:
+            due = self._real_start + (target - self.start).total_seconds() / self.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.current = target
+
+def backfill(start: datetime, end: datetime, client, speed: float = 0.0) -> Tuple[int, float]:
+    """Replay the production plans of [start, end) on a virtual clock; returns (updates, wall seconds).
+
+    Plans are refreshed at their start/end boundaries only, since historical rows do not
+    change. Checkpoints are not used so a backfill never resumes or overwrites live counters.
+    """
+    simulator = DataSimulator(EXCEL_FILE_PATH, DB_URL, checkpoint_path=None, background_refresh=False)
+    simulator.sink_flush_interval = 0  # virtual seconds fly by; the sink is flushed when the run ends
+    clock = VirtualClock(start, speed)
+    scheduler = ProductionScheduler()
+    published = 0
+    wall_start = time.time()
+    try:
+        with client.connection() as conn:
+            if MQTT_BATCH_ENABLED:
+                simulator.enable_batching(conn)
+                simulator.batcher.last_flush = start.timestamp()
+            refresh_at: Optional[datetime] = start
+            while clock.now() < end:
+                now = clock.now()
+                if refresh_at is not None and now >= refresh_at:
+                    if not simulator.refresh_active_plans(now):
+                        # Refresh failed: nothing else is due before it, so wait out the backoff and retry
+                        time.sleep(max(0.0, simulator.backoff.retry_at - time.time()))
+                        continue
+                    scheduler.sync_plans(simulator, now)
+                    refresh_at = simulator.next_plan_transition
+                published += scheduler.publish(simulator, conn, now)
+                next_flush = simulator.flush_due(now)
+                deadline = min(d for d in (scheduler.next_due(), refresh_at, end) if d is not None)
+                if next_flush != float('inf'):
+                    deadline = min(deadline, datetime.fromtimestamp(next_flush))
+                clock.advance_to(deadline)
+            if simulator.batcher is not None:
+                simulator.batcher.flush(end.timestamp())
+    finally:
+        simulator.close()
+    return published, time.time() - wall_start
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate historical simulation data over a date range.")
+    parser.add_argument('--start', required=True, type=datetime.fromisoformat, help="ISO date/time to start at")
+    parser.add_argument('--end', type=datetime.fromisoformat, help="ISO date/time to stop at (default: now)")
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help="virtual seconds per real second, 0 runs as fast as the output allows")
+    parser.add_argument('--output', choices=('mqtt', 'ndjson', 'parquet', 'db'), default='mqtt')
+    parser.add_argument('--path', help="file to write (ndjson/parquet output) or table name (db output)")
+    args = parser.parse_args()
+    end = args.end or datetime.now()
+    if end <= args.start:
+        parser.error("--end must be after --start")
+
+    print(f"🚀 Backfilling {args.start} to {end} to {args.output}...")
+    try:
+        published, elapsed = backfill(args.start, end, create_output(args.output, args.path), args.speed)
+    except KeyboardInterrupt:
+        print("🛑 User stopped.")
+        return
+    simulated = (end - args.start).total_seconds()
+    print(f"✅ Backfill done: {published} updates, {simulated / max(elapsed, 1e-9):,.0f}x real time "
+          f"({timedelta(seconds=simulated)} in {elapsed:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+from config import EXCEL_FILE_PATH, DB_URL, MQTT_BATCH_ENABLED, GUIDE_RELOAD_INTERVAL, METRICS_PORT, METRICS_HOST
+import threading
+import time
+import numpy as np
+from datetime import datetime
+from typing import List, Optional, Tuple
+import paho.mqtt.client as mqtt
+from data_simulation import (create_output, DataSimulator, GuideSpec, REJECT_INTERVAL, PRODUCED, REJECT,
+                             PUBLISH_LOG, UPDATES_BY_KIND, SHUTDOWN, on_shutdown)
+from metrics import TICK_SECONDS, start_metrics_server
+
+BATCH_TICK_SECONDS = TICK_SECONDS.labels('batch')
+
+class BatchTickEngine:
+    """Columnar view of the active plans so one tick decides every due hierarchy at once."""
+
+    def __init__(self, simulator: DataSimulator):
+        self.simulator = simulator
+        self.plans: List[dict] = []
+        self.specs: List[GuideSpec] = []
+        self.hierarchies: List[str] = []
+        self.freq_seconds = np.empty(0, dtype=np.float64)
+        self.total_units = np.empty(0, dtype=np.int64)
+        self.reject_per_hr = np.empty(0, dtype=np.int64)
+        self.produced = np.empty(0, dtype=np.int64)
+        self.next_produced = np.empty(0, dtype=np.float64)  # epoch seconds
+        self.next_reject = np.empty(0, dtype=np.float64)  # epoch seconds
+
+    def load_plans(self):
+        """Rebuild the arrays from the simulator's active plans, keeping its counters."""
+        sim = self.simulator
+        plans, specs = [], []
+        for plan in sim.active_plans.values():
+            spec = sim.require_guide(plan)
+            if spec is None:
+                continue
+            plans.append(plan)
+            specs.append(spec)
+        self.plans = plans
+        self.specs = specs
+        self.hierarchies = [spec.hierarchy for spec in specs]
+        self.freq_seconds = np.array([spec.freq_seconds for spec in specs], dtype=np.float64)
+        self.total_units = np.array([spec.total_units for spec in specs], dtype=np.int64)
+        self.reject_per_hr = np.array([spec.reject_per_hr for spec in specs], dtype=np.int64)
+        hierarchies = self.hierarchies
+        self.produced = np.array([sim.produced_count.get(h, 0) for h in hierarchies], dtype=np.int64)
+        last_produced = np.array([self._last_ts(sim.last_produced_push.get(h)) for h in hierarchies],
+                                 dtype=np.float64)
+        last_reject = np.array([self._last_ts(sim.last_reject_push.get(h)) for h in hierarchies],
+                               dtype=np.float64)
+        self.next_produced = last_produced + self.freq_seconds
+        self.next_reject = last_reject + REJECT_INTERVAL.total_seconds()
+
+    @staticmethod
+    def _last_ts(last_push: datetime) -> float:
+        # Never pushed: pretend the last push was infinitely long ago so it is due immediately.
+        return -np.inf if last_push is None else last_push.timestamp()
+
+    def tick(self, now: datetime) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Advance counters of every due hierarchy; returns the produced/reject indices and reject counts."""
+        ts = now.timestamp()
+        model = self.simulator.model
+        produced_due = np.flatnonzero(self.next_produced <= ts)
+        reject_due = np.flatnonzero(self.next_reject <= ts)
+        if len(produced_due):
+            self.produced[produced_due] += model.produced(
+                [self.hierarchies[i] for i in produced_due.tolist()], self.total_units[produced_due], ts)
+        self.next_produced[produced_due] = ts + self.freq_seconds[produced_due]
+        rejects = np.empty(0, dtype=np.int64)
+        if len(reject_due):
+            rejects = model.rejects([self.hierarchies[i] for i in reject_due.tolist()],
+                                    self.reject_per_hr[reject_due], self.total_units[reject_due],
+                                    self.freq_seconds[reject_due])
+        self.next_reject[reject_due] = ts + REJECT_INTERVAL.total_seconds()
+        return produced_due, reject_due, rejects
+
+    def next_due(self) -> float:
+        """Epoch seconds of the earliest pending deadline (inf when idle)."""
+        if not self.plans:
+            return np.inf
+        return float(min(self.next_produced.min(), self.next_reject.min()))
+
+    def dispatch(self, client: mqtt.Client, now: datetime) -> Optional[datetime]:
+        """Publish this tick's updates and return the next publish or flush deadline."""
+        self.publish(client, now)
+        deadline = min(self.next_due(), self.simulator.flush_due(now))
+        return None if deadline == np.inf else datetime.fromtimestamp(deadline)
+
+    def publish(self, client: mqtt.Client, now: datetime) -> int:
+        """Run one tick and publish every due update, returning the number of messages sent."""
+        sim = self.simulator
+        tick_start = time.perf_counter()
+        produced_due, reject_due, rejects = self.tick(now)
+        ts = now.timestamp()
+        for i in produced_due.tolist():
+            spec = self.specs[i]
+            count = int(self.produced[i])
+            data = {spec.key_prod: count, spec.key_prod_hierarchy: spec.hierarchy}
+            sim.send(client, data, ts, self.plans[i]['project_id'], spec.site_id)
+            sim.produced_count[spec.hierarchy] = count
+            sim.last_produced_push[spec.hierarchy] = now
+            sim.save_checkpoint(self.plans[i])
+        for i, rejected in zip(reject_due.tolist(), rejects.tolist()):
+            spec = self.specs[i]
+            data = {spec.key_reject: rejected, spec.key_reject_hierarchy: spec.hierarchy}
+            sim.send(client, data, ts, self.plans[i]['project_id'], spec.site_id)
+            sim.last_reject_push[spec.hierarchy] = now
+            sim.save_checkpoint(self.plans[i])
+        sent = len(produced_due) + len(reject_due)
+        if sent:
+            BATCH_TICK_SECONDS.observe(time.perf_counter() - tick_start)
+            UPDATES_BY_KIND[PRODUCED].inc(len(produced_due))
+            UPDATES_BY_KIND[REJECT].inc(len(reject_due))
+        if sent and PUBLISH_LOG.allow():
+            PUBLISH_LOG.emit('batch_tick', f"📤 Batch tick at {now.time()}: {len(produced_due)} produced, "
+                             f"{len(reject_due)} reject pushed", produced=len(produced_due),
+                             rejects=len(reject_due), at=now)
+        return sent
+
+def batch_simulation():
+    """Run the simulation with the columnar tick engine."""
+    print("🚀 Starting batch tick simulation...")
+
+    simulator = None
+    try:
+        mqtt_client = create_output()
+        simulator = DataSimulator(EXCEL_FILE_PATH, DB_URL)
+        start_metrics_server(METRICS_PORT, METRICS_HOST)
+        engine = BatchTickEngine(simulator)
+        wake = threading.Event()
+        simulator.wake = wake.set
+        on_shutdown(wake.set)
+
+        with mqtt_client.connection() as client:
+            simulator.sink_for(client)
+            if MQTT_BATCH_ENABLED:
+                simulator.enable_batching(client)
+            if GUIDE_RELOAD_INTERVAL > 0:
+                simulator.start_guide_watch(GUIDE_RELOAD_INTERVAL)
+            while not SHUTDOWN.is_set():
+                now = datetime.now()
+                guide_changed = simulator.apply_pending_guide()
+                refreshed = simulator.refresh_due(now) and simulator.refresh_active_plans()
+                if refreshed or guide_changed:
+                    engine.load_plans()
+                deadline = engine.dispatch(client, now)
+                next_refresh = simulator.next_refresh_at(now)
+                deadline = next_refresh if deadline is None else min(deadline, next_refresh)
+                timeout = (deadline - datetime.now()).total_seconds()
+                if timeout > 0:
+                    wake.wait(timeout)
+                wake.clear()
+            if simulator.batcher is not None:
+                simulator.batcher.flush()
+
+    except KeyboardInterrupt:
+        print("🛑 User stopped.")
+    except Exception as e:
+        print(f"Error in batch simulation: {e}")
+        raise
+    finally:
+        if simulator is not None:
+            simulator.close()
+        print("🔌 MQTT disconnected.")
+
+if __name__ == "__main__":
+    batch_simulation()
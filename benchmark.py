@@ -0,0 +1,260 @@
+import argparse
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from config import SHEET_DATA_GUIDE, SHEET_TAGS
+from data_simulation import DataSimulator, ProductionScheduler
+from batch_engine import BatchTickEngine
+from serializers import SERIALIZERS, EnvelopeTemplate, get_serializer
+from productionplan_importer import import_productionplan
+from fake_broker import FakeBroker
+from mqtt_transport import AsyncMQTTTransport
+
+# Metrics where a lower value is better; every other metric is a throughput.
+LOWER_IS_BETTER = ('p50_ms', 'p99_ms', 'peak_rss_mb')
+# Latency changes smaller than this are timer noise, whatever their relative size.
+LATENCY_NOISE_MS = 0.5
+
+class CountingClient:
+    """Stand-in for an MQTT connection that only counts what would have been published."""
+
+    def __init__(self):
+        self.published = 0
+        self.bytes = 0
+
+    def publish(self, topic: str, payload: bytes):
+        self.published += 1
+        self.bytes += len(payload)
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield self
+
+def synthetic_sheets(rows: int, products: int = 50, seed: int = 1) -> Dict[str, pd.DataFrame]:
+    """tags, product and data_guide sheets with rows hierarchies spread over 100 sites."""
+    rng = np.random.default_rng(seed)
+    names = [f"Product {i}" for i in range(products)]
+    hierarchies = [f"l1_{i % 100}$l2_{i // 100 % 100}$l3_{i}$ast_{i}" for i in range(rows)]
+    guide = pd.DataFrame({
+        "name": [names[i % products] for i in range(rows)],
+        "hierarchy": hierarchies,
+        "Duration_hrs": rng.choice([6, 8, 12], rows),
+        "type": "hour",
+        "planned_quantity": rng.integers(100, 1000, rows),
+        "actual quant": rng.integers(50, 900, rows),
+        "frequency": rng.integers(1, 11, rows),
+        "reject_per_hr": rng.integers(0, 10, rows),
+        "total_units": rng.integers(1, 10, rows),
+    })
+    return {
+        SHEET_TAGS: pd.DataFrame({"equipment_status": ["tag_114"], "total_produced_units": ["tag_101"],
+                                  "reject_units": ["tag_100"]}),
+        "product": pd.DataFrame({"project_id": "project_bench", "name": names}),
+        SHEET_DATA_GUIDE: guide,
+    }
+
+def synthetic_plans(sheets: Dict[str, pd.DataFrame], start: datetime) -> List[dict]:
+    guide = sheets[SHEET_DATA_GUIDE]
+    return [
+        {"id": i + 1, "hierarchy": hierarchy, "name": name, "product": i % 50 + 1, "process_order": 1,
+         "project_id": "project_bench", "start_time": start, "end_time": start + timedelta(hours=8)}
+        for i, (hierarchy, name) in enumerate(zip(guide["hierarchy"], guide["name"]))
+    ]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is the peak of the whole process, so scenarios run in their own process (isolated)
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+def bench_ticks(rows: int, mode: str, duration: timedelta, step: timedelta) -> Dict[str, float]:
+    """Drive one simulator over duration of virtual time in steps, timing each tick."""
+    sheets = synthetic_sheets(rows)
+    start = datetime(2026, 1, 5, 6, 0)
+    simulator = DataSimulator('synthetic', None, checkpoint_path=None, sheets=sheets)
+    simulator.apply_active_plans(synthetic_plans(sheets, start), start)
+    client = CountingClient()
+    if mode == 'batch':
+        engine = BatchTickEngine(simulator)
+        engine.load_plans()
+        tick = lambda now: engine.dispatch(client, now)
+    else:
+        scheduler = ProductionScheduler()
+        scheduler.sync_plans(simulator, start)
+        tick = lambda now: scheduler.dispatch(simulator, client, now)
+    latencies = []
+    now = start
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        wall_start = time.perf_counter()
+        while now < start + duration:
+            tick_start = time.perf_counter()
+            tick(now)
+            latencies.append(time.perf_counter() - tick_start)
+            now += step
+        elapsed = time.perf_counter() - wall_start
+    simulator.close()
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "ticks_per_sec": len(latencies) / elapsed,
+        "publishes_per_sec": client.published / elapsed,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def bench_serializers(n: int = 100000) -> Dict[str, float]:
+    hierarchy = "l1_100$l2_101$l3_102$l4_103$l5_104$l6_105$l7_106$ast_107"
+    results = {}
+    for name in SERIALIZERS:
+        try:
+            render = EnvelopeTemplate(get_serializer(name)).render
+        except ValueError:
+            continue
+        wall_start = time.perf_counter()
+        for i in range(n):
+            render({f"{hierarchy}$tag_101": i, f"{hierarchy}$tag_101_hierarchy": hierarchy},
+                   1767592800.0, "project_bench", "l1_100")
+        results[f"{name}_msgs_per_sec"] = n / (time.perf_counter() - wall_start)
+    return results
+
+def bench_broker(n: int = 20000) -> Dict[str, float]:
+    """Publish n QoS 1 messages through the asyncio transport to an in-process fake broker."""
+    broker = FakeBroker(keep_messages=False).start()
+    render = EnvelopeTemplate(get_serializer('json')).render
+    hierarchy = "l1_100$l2_101$l3_102$l4_103$l5_104$l6_105$l7_106$ast_107"
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            transport = AsyncMQTTTransport(broker.host, broker.port, qos=1)
+            wall_start = time.perf_counter()
+            with transport.connection() as client:
+                for i in range(n):
+                    data = {f"{hierarchy}$tag_101": i}
+                    client.publish("bench", render(data, 1767592800.0, "project_bench", "l1_100"))
+            elapsed = time.perf_counter() - wall_start
+    finally:
+        broker.stop()
+    return {"publishes_per_sec": n / elapsed}
+
+def bench_importer(rows: int, db_url: Optional[str] = None) -> Dict[str, float]:
+    """Import a synthetic data_guide into a fresh SQLite file, or a scratch database at db_url.
+
+    The product, processorder and productionplan tables are dropped and recreated first.
+    """
+    sheets = synthetic_sheets(rows)
+    path = None
+    if db_url is None:
+        path = os.path.abspath(f"bench-import-{os.getpid()}.db")
+        db_url = f"sqlite:///{path}"
+    engine = create_engine(db_url)
+    # The importer leaves productionplan ids to the database: SQLite's INTEGER PRIMARY KEY is a rowid
+    # alias, Postgres needs an identity column
+    plan_id = ("id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY" if engine.dialect.name == 'postgresql'
+               else "id INTEGER PRIMARY KEY")
+    with engine.begin() as conn:
+        for ddl in (
+            "DROP TABLE IF EXISTS productionplan", "DROP TABLE IF EXISTS product", "DROP TABLE IF EXISTS processorder",
+            "CREATE TABLE product (id INTEGER PRIMARY KEY, name TEXT, project_id TEXT)",
+            "CREATE TABLE processorder (id INTEGER PRIMARY KEY)",
+            f"CREATE TABLE productionplan ({plan_id}, project_id TEXT, meta TEXT, hierarchy TEXT, "
+            "product INTEGER, process_order INTEGER, start_time TIMESTAMP, end_time TIMESTAMP, "
+            "planned_quantity INTEGER, oee_target INTEGER, performance_target INTEGER, "
+            "availability_target INTEGER, quality_target INTEGER)",
+            "CREATE INDEX ix_productionplan_lookup ON productionplan (product, hierarchy, start_time)",
+        ):
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO processorder (id) VALUES (1)"))
+        conn.execute(text("INSERT INTO product (id, name, project_id) VALUES (:id, :name, :project_id)"),
+                     [{"id": i + 1, "name": name, "project_id": project_id}
+                      for i, (name, project_id) in enumerate(zip(sheets["product"]["name"],
+                                                                 sheets["product"]["project_id"]))])
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            wall_start = time.perf_counter()
+            import_productionplan(engine, sheets)
+            elapsed = time.perf_counter() - wall_start
+        with engine.connect() as conn:
+            inserted = conn.execute(text("SELECT COUNT(*) FROM productionplan")).scalar()
+    finally:
+        engine.dispose()
+        if path is not None:
+            os.remove(path)
+    return {"importer_rows_per_sec": inserted / elapsed, "peak_rss_mb": peak_rss_mb()}
+
+def isolated(bench: Callable[..., Dict[str, float]], *args) -> Dict[str, float]:
+    """Run one scenario in a fresh spawned process, so its peak_rss_mb is its own."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn')) as pool:
+        return pool.submit(bench, *args).result()
+
+def run(sizes: List[int], modes: List[str], minutes: int, import_db: Optional[str],
+        broker: bool) -> Dict[str, Dict[str, float]]:
+    results = {"serialize": isolated(bench_serializers)}
+    if broker:
+        results["broker"] = isolated(bench_broker)
+    for rows in sizes:
+        for mode in modes:
+            results[f"tick/{mode}/{rows}"] = isolated(bench_ticks, rows, mode, timedelta(minutes=minutes),
+                                                      timedelta(seconds=1))
+        results[f"import/{rows}"] = isolated(bench_importer, rows, import_db)
+    return results
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> int:
+    """Print changes against baseline and return how many metrics regressed beyond tolerance."""
+    regressions = 0
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+            if metric.endswith('_ms') and abs(value - old) < LATENCY_NOISE_MS:
+                worse = False
+            regressions += worse
+            flag = "  REGRESSION" if worse else ""
+            print(f"  {name:<24} {metric:<24} {old:>14,.2f} -> {value:>14,.2f} ({change:+.1%}){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark simulator ticks, serialization and the importer.")
+    parser.add_argument('--sizes', default='1000,10000', help="comma separated data_guide row counts")
+    parser.add_argument('--modes', default='event,batch', help="simulation engines to run: event, batch")
+    parser.add_argument('--minutes', type=int, default=10, help="virtual minutes simulated per tick run (1s ticks)")
+    parser.add_argument('--broker', action='store_true', help="also publish through a fake MQTT broker")
+    parser.add_argument('--import-db', help="scratch database URL for the importer run, its plan tables are recreated "
+                             "(default: a temporary SQLite file)")
+    parser.add_argument('--save', help="write results to this JSON file as the new baseline")
+    parser.add_argument('--baseline', help="compare against this JSON baseline, exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed relative change before flagging")
+    args = parser.parse_args()
+
+    results = run([int(size) for size in args.sizes.split(',')], args.modes.split(','), args.minutes, args.import_db,
+                  args.broker)
+    for name, metrics in results.items():
+        print(f"{name}:")
+        for metric, value in metrics.items():
+            print(f"  {metric:<24} {value:>14,.2f}")
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"[INFO] Saved baseline to {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared to {args.baseline}:")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"[WARN] {regressions} metrics regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+class Checkpoint:
+    __slots__ = ('produced_count', 'last_produced_push', 'last_reject_push')
+
+    def __init__(self, produced_count: int, last_produced_push: Optional[datetime],
+                 last_reject_push: Optional[datetime]):
+        self.produced_count = produced_count
+        self.last_produced_push = last_produced_push
+        self.last_reject_push = last_reject_push
+
+class CheckpointStore:
+    """Produced counters and last push times per (plan id, hierarchy) in a local SQLite file.
+
+    Updates are staged in memory and written in one transaction every flush_interval
+    seconds, so a restart resumes counters instead of starting from 0. Worker processes
+    can share the file; WAL mode lets their batched writes interleave.
+    """
+
+    def __init__(self, path, flush_interval: float = 5.0):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoint (
+                plan_id INTEGER NOT NULL,
+                hierarchy TEXT NOT NULL,
+                produced_count INTEGER NOT NULL,
+                last_produced REAL,
+                last_reject REAL,
+                end_time REAL,
+                PRIMARY KEY (plan_id, hierarchy)
+            )
+        """)
+        self._conn.commit()
+        self._pending: Dict[Tuple[int, str], tuple] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+
+    @staticmethod
+    def _ts(value: Optional[datetime]) -> Optional[float]:
+        return None if value is None else value.timestamp()
+
+    @staticmethod
+    def _dt(value: Optional[float]) -> Optional[datetime]:
+        return None if value is None else datetime.fromtimestamp(value)
+
+    def get(self, plan_id: int, hierarchy: str) -> Optional[Checkpoint]:
+        """Last saved state of a plan on a hierarchy, or None if it never published."""
+        key = (plan_id, hierarchy)
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                row = self._conn.execute(
+                    "SELECT produced_count, last_produced, last_reject, end_time FROM checkpoint "
+                    "WHERE plan_id = ? AND hierarchy = ?", key
+                ).fetchone()
+        if row is None:
+            return None
+        return Checkpoint(row[0], self._dt(row[1]), self._dt(row[2]))
+
+    def record(self, plan: dict, produced_count: int, last_produced_push: Optional[datetime],
+               last_reject_push: Optional[datetime]):
+        """Stage the current state of plan; written on the next flush."""
+        end_time = plan.get('end_time')
+        with self._lock:
+            self._pending[(plan['id'], plan['hierarchy'])] = (
+                produced_count, self._ts(last_produced_push), self._ts(last_reject_push), self._ts(end_time)
+            )
+
+    def flush_due(self, now_ts: float):
+        if now_ts - self._last_flush >= self.flush_interval:
+            self.flush(now_ts)
+
+    def flush(self, now_ts: Optional[float] = None):
+        """Write staged updates and drop checkpoints of plans that ended a day ago or earlier."""
+        now_ts = time.time() if now_ts is None else now_ts
+        self._last_flush = now_ts
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        try:
+            with self._conn:
+                if pending:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO checkpoint "
+                        "(plan_id, hierarchy, produced_count, last_produced, last_reject, end_time) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        [key + row for key, row in pending.items()]
+                    )
+                self._conn.execute("DELETE FROM checkpoint WHERE end_time < ?", (now_ts - 86400,))
+        except sqlite3.Error as e:
+            print(f"[ERROR] Writing checkpoints failed, retrying on the next flush: {e}")
+            with self._lock:
+                for key, row in pending.items():
+                    self._pending.setdefault(key, row)
+
+    def next_flush(self) -> float:
+        """Epoch seconds of the next flush (inf when nothing is staged)."""
+        return self._last_flush + self.flush_interval if self._pending else float('inf')
+
+    def close(self):
+        self.flush()
+        self._conn.close()
@@ -18,6 +18,19 @@ DB_URL = os.getenv('POSTGRES_URI')
 if not DB_URL:
     raise ValueError("POSTGRES_URI not set in environment variables.")
 
+# Shared SQLAlchemy pool (see db.py): connections kept open, extra ones allowed under load,
+# and seconds before a connection is recycled. Connections are pinged before each checkout.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '300'))
+# Postgres connect and per-statement timeouts in seconds, so a hung database fails instead of blocking (0 disables)
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '10'))
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', '60'))
+# Seconds a background plan refresh may run before it is abandoned and retried with backoff (0 waits forever)
+DB_REFRESH_TIMEOUT = float(os.getenv('DB_REFRESH_TIMEOUT', str(DB_CONNECT_TIMEOUT + 2 * DB_STATEMENT_TIMEOUT)))
+# Run plan refreshes on an asyncio engine (asyncpg) off the simulation loop; needs asyncpg
+DB_ASYNC = os.getenv('DB_ASYNC', 'false').strip().lower() in ('1', 'true', 'yes')
+
 # Excel Configuration
 EXCEL_FILE_NAME = os.getenv('EXCEL_FILE_NAME')
 if not EXCEL_FILE_NAME:
@@ -28,4 +41,67 @@ EXCEL_FILE_PATH = BASE_DIR / EXCEL_FILE_NAME
 SHEET_DATA_GUIDE = 'data_guide'
 SHEET_TAGS = 'tags'
 
+# Parsed workbook cache shared by the simulator and the importer (empty disables the disk cache)
+WORKBOOK_CACHE_DIR = os.getenv('WORKBOOK_CACHE_DIR', str(BASE_DIR / '.cache' / 'workbooks')).strip()
+# Seconds between checks of the workbook for data_guide/tags edits (0 disables hot reload)
+GUIDE_RELOAD_INTERVAL = float(os.getenv('GUIDE_RELOAD_INTERVAL', '5'))
+
+# Produced counters and push times per plan, so restarts resume instead of resetting (empty disables)
+CHECKPOINT_PATH = os.getenv('CHECKPOINT_PATH', str(BASE_DIR / '.cache' / 'checkpoints.sqlite3')).strip()
+CHECKPOINT_FLUSH_INTERVAL = float(os.getenv('CHECKPOINT_FLUSH_INTERVAL', '5'))
+
+# Port of the Prometheus /metrics and /profile endpoint (0 disables it); workers use the next ports
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+# Interface the endpoint binds to; set 0.0.0.0 to let a remote Prometheus scrape it
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1').strip()
+# Cap on per-publish/per-row log lines per second, the rest are summarized (0 silences them)
+LOG_MAX_LINES_PER_SEC = float(os.getenv('LOG_MAX_LINES_PER_SEC', '20'))
+# Format of those lines: 'text' (as before) or 'json' (one record per line with event and fields)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').strip().lower()
+
+# Generation model: 'fixed' (data_guide values as is) or 'stochastic' (Poisson output,
+# micro-stops, throughput-linked rejects). MODEL_SEED makes stochastic runs reproducible;
+# when unset a random seed is drawn and logged.
+PRODUCTION_MODEL = os.getenv('PRODUCTION_MODEL', 'fixed').strip().lower()
+MODEL_SEED = int(os.getenv('MODEL_SEED')) if os.getenv('MODEL_SEED', '').strip() else None
+MODEL_STOP_PROBABILITY = float(os.getenv('MODEL_STOP_PROBABILITY', '0.02'))  # per frequency interval
+MODEL_MEAN_DOWNTIME = float(os.getenv('MODEL_MEAN_DOWNTIME', '600'))  # seconds
+
+# Production plan refresh: 'full' re-reads all active plans every interval, 'incremental'
+# only fetches plans whose start/end crossed since the last refresh (with a periodic full
+# reconcile). Either way a refresh also fires at the next known plan boundary.
+PLAN_REFRESH_MODE = os.getenv('PLAN_REFRESH_MODE', 'full').strip().lower()
+PLAN_REFRESH_INTERVAL = float(os.getenv('PLAN_REFRESH_INTERVAL', '60'))
+PLAN_FULL_REFRESH_INTERVAL = float(os.getenv('PLAN_FULL_REFRESH_INTERVAL', '900'))
+# Postgres LISTEN/NOTIFY channel for immediate plan updates (empty disables it)
+PLAN_NOTIFY_CHANNEL = os.getenv('PLAN_NOTIFY_CHANNEL', '').strip()
+
+# Simulation engine: 'event' (per-hierarchy deadline heap) or 'batch' (vectorized tick engine)
+SIMULATION_MODE = os.getenv('SIMULATION_MODE', 'event').strip().lower()
+
+# Number of simulation worker processes; above 1 a supervisor partitions plans by site
+SIMULATION_WORKERS = int(os.getenv('SIMULATION_WORKERS', '1'))
+
+# Batched publishing: merge updates sharing project/site into one message per flush
+MQTT_BATCH_ENABLED = os.getenv('MQTT_BATCH_ENABLED', 'false').strip().lower() in ('1', 'true', 'yes')
+MQTT_BATCH_MAX_BYTES = int(os.getenv('MQTT_BATCH_MAX_BYTES', '262144'))
+MQTT_BATCH_FLUSH_INTERVAL = float(os.getenv('MQTT_BATCH_FLUSH_INTERVAL', '1.0'))
+
+# Where simulated messages go: 'mqtt' (the broker), or 'ndjson'/'parquet' files or a 'db' table
+# at SIMULATION_SINK_PATH (the table name for db). Worker processes append their index to the path.
+SIMULATION_SINK = os.getenv('SIMULATION_SINK', 'mqtt').strip().lower()
+SIMULATION_SINK_PATH = os.getenv('SIMULATION_SINK_PATH', '').strip()
+# Seconds between flushes of the file/db sink's buffer, so a killed process loses at most this much
+SIMULATION_SINK_FLUSH_INTERVAL = float(os.getenv('SIMULATION_SINK_FLUSH_INTERVAL', '5'))
+
+# Wire format of published messages: 'json' (stdlib), 'orjson' or 'msgpack'
+MQTT_SERIALIZER = os.getenv('MQTT_SERIALIZER', 'json')
+
+# MQTT transport: 'threaded' (paho loop_start) or 'asyncio' (bounded queue, ack tracking)
+MQTT_TRANSPORT = os.getenv('MQTT_TRANSPORT', 'threaded').strip().lower()
+MQTT_QOS = int(os.getenv('MQTT_QOS', '1'))
+MQTT_MAX_INFLIGHT = int(os.getenv('MQTT_MAX_INFLIGHT', '100'))
+MQTT_QUEUE_SIZE = int(os.getenv('MQTT_QUEUE_SIZE', '10000'))
 
+# Number of MQTT connections; hierarchies are sharded across them by site id
+MQTT_POOL_SIZE = int(os.getenv('MQTT_POOL_SIZE', '1'))
@@ -1,12 +1,34 @@
-from config import MQTT_BROKER, MQTT_PORT, MQTT_TOPIC, EXCEL_FILE_PATH, SHEET_TAGS, DB_URL
+from config import (MQTT_BROKER, MQTT_PORT, MQTT_TOPIC, EXCEL_FILE_PATH, SHEET_TAGS, SHEET_DATA_GUIDE, DB_URL,
+                    MQTT_BATCH_ENABLED, MQTT_BATCH_MAX_BYTES, MQTT_BATCH_FLUSH_INTERVAL, MQTT_SERIALIZER,
+                    MQTT_TRANSPORT, MQTT_QOS, MQTT_MAX_INFLIGHT, MQTT_QUEUE_SIZE, MQTT_POOL_SIZE,
+                    PLAN_REFRESH_MODE, PLAN_REFRESH_INTERVAL, PLAN_FULL_REFRESH_INTERVAL, PLAN_NOTIFY_CHANNEL,
+                    GUIDE_RELOAD_INTERVAL, CHECKPOINT_PATH, CHECKPOINT_FLUSH_INTERVAL,
+                    SIMULATION_SINK, SIMULATION_SINK_PATH, SIMULATION_SINK_FLUSH_INTERVAL, METRICS_PORT, METRICS_HOST, LOG_MAX_LINES_PER_SEC, LOG_FORMAT,
+                    PRODUCTION_MODEL, MODEL_SEED, MODEL_STOP_PROBABILITY, MODEL_MEAN_DOWNTIME, DB_ASYNC,
+                    DB_REFRESH_TIMEOUT)
+import numpy as np
 import pandas as pd
-import json
+import sys
 from datetime import datetime, timedelta
 import time
+import heapq
+import itertools
+import threading
 import paho.mqtt.client as mqtt
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List, Optional, Tuple, Union
+from concurrent.futures import Future
 from contextlib import contextmanager
-from sqlalchemy import create_engine, text
+from publisher import MessageBatcher
+from mqtt_transport import AsyncMQTTTransport, MQTTClientPool
+from plan_refresh import PlanChangeListener, fetch_plans, fetch_plans_async
+from db import AsyncRunner, Backoff, get_async_engine, get_engine, health_check
+from serializers import EnvelopeTemplate, get_serializer
+from workbook_cache import WORKBOOK_CACHE
+from checkpoint import CheckpointStore
+from production_model import ProductionModel, create_model
+from sinks import Sink, MQTTSink, create_file_sink
+from metrics import (TICK_SECONDS, UPDATES, ACTIVE_PLANS, PUBLISH_SECONDS, PLAN_REFRESH_SECONDS,
+                     PLAN_REFRESH_ERRORS, RateLimitedLog, start_metrics_server)
 
 class MQTTClient:
     def __init__(self, broker: str, port: int):
@@ -52,77 +74,468 @@ class MQTTClient:
             self.client.loop_stop()
             self.client.disconnect()
 
+def create_mqtt_client(pool_size: int = MQTT_POOL_SIZE):
+    """Build the MQTT client for the configured MQTT_TRANSPORT, pooled when pool_size > 1."""
+    if pool_size > 1:
+        return MQTTClientPool(lambda: create_mqtt_client(pool_size=1), pool_size)
+    if MQTT_TRANSPORT == 'asyncio':
+        return AsyncMQTTTransport(MQTT_BROKER, MQTT_PORT, qos=MQTT_QOS,
+                                  max_inflight=MQTT_MAX_INFLIGHT, queue_size=MQTT_QUEUE_SIZE)
+    return MQTTClient(MQTT_BROKER, MQTT_PORT)
+
+def create_output(kind: str = SIMULATION_SINK, path: Optional[str] = SIMULATION_SINK_PATH):
+    """MQTT client for the mqtt sink, otherwise the ndjson/parquet/db sink; both have connection()."""
+    if kind == 'mqtt':
+        return create_mqtt_client()
+    return create_file_sink(kind, path, DB_URL)
+
+PRODUCED = 'produced'
+REJECT = 'reject'
+REJECT_INTERVAL = timedelta(hours=1)
+
+# Set by request_shutdown(): the simulation loops exit, closing their output (file footers, buffers)
+SHUTDOWN = threading.Event()
+_shutdown_wakers: List[Callable[[], None]] = []
+
+def on_shutdown(wake: Callable[[], None]):
+    """Register a simulation loop's wake callback, so it notices SHUTDOWN without waiting out its timeout."""
+    _shutdown_wakers.append(wake)
+
+def request_shutdown():
+    """Stop the simulation loops running in this process (app.py runs them in a daemon thread)."""
+    SHUTDOWN.set()
+    for wake in list(_shutdown_wakers):
+        wake()
+
+# Per-publish lines are capped so they cannot dominate the loop with many hierarchies
+PUBLISH_LOG = RateLimitedLog(LOG_MAX_LINES_PER_SEC, LOG_FORMAT)
+# One line per resumed hierarchy, which is every active one after a restart
+RESUME_LOG = RateLimitedLog(LOG_MAX_LINES_PER_SEC, LOG_FORMAT)
+EVENT_TICK_SECONDS = TICK_SECONDS.labels('event')
+UPDATES_BY_KIND = {PRODUCED: UPDATES.labels(PRODUCED), REJECT: UPDATES.labels(REJECT)}
+
+class ProductionScheduler:
+    """Min-heap of produced/reject deadlines, one entry per hierarchy and kind."""
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, str, str, int]] = []  # (due, seq, hierarchy, kind, token)
+        self._seq = itertools.count()
+        self._tokens: Dict[str, int] = {}  # hierarchy -> token of its current plan assignment
+        self._plan_ids: Dict[str, int] = {}  # hierarchy -> plan id the token belongs to
+        self._wake = threading.Event()
+
+    def sync_plans(self, simulator: 'DataSimulator', now: datetime):
+        """Schedule hierarchies whose plan changed and drop the ones no longer active."""
+        active_plan_ids = simulator.active_plan_ids
+        for hierarchy in list(self._plan_ids):
+            if hierarchy not in active_plan_ids:
+                del self._plan_ids[hierarchy]
+                del self._tokens[hierarchy]
+        for hierarchy, plan_id in active_plan_ids.items():
+            if self._plan_ids.get(hierarchy) == plan_id:
+                continue
+            self._plan_ids[hierarchy] = plan_id
+            self._schedule_next(simulator, hierarchy, now)
+
+    def schedule(self, hierarchy: str, kind: str, due: datetime):
+        token = self._tokens.get(hierarchy)
+        if token is None:
+            return
+        heapq.heappush(self._heap, (due, next(self._seq), hierarchy, kind, token))
+
+    def reschedule(self, simulator: 'DataSimulator', hierarchies: List[str], now: datetime):
+        """Replace the pending entries of hierarchies whose data_guide spec changed."""
+        for hierarchy in hierarchies:
+            if hierarchy in self._tokens:
+                self._schedule_next(simulator, hierarchy, now)
+
+    def _schedule_next(self, simulator: 'DataSimulator', hierarchy: str, now: datetime):
+        """Replace a hierarchy's entries with deadlines following its last pushes (now if it never pushed)."""
+        self._tokens[hierarchy] = next(self._seq)
+        spec = simulator.guide_for(simulator.active_plans[hierarchy])
+        last_produced = simulator.last_produced_push.get(hierarchy)
+        last_reject = simulator.last_reject_push.get(hierarchy)
+        self.schedule(hierarchy, PRODUCED,
+                      now if last_produced is None or spec is None else last_produced + spec.frequency)
+        self.schedule(hierarchy, REJECT, now if last_reject is None else last_reject + REJECT_INTERVAL)
+
+    def _discard_stale(self):
+        while self._heap and self._tokens.get(self._heap[0][2]) != self._heap[0][4]:
+            heapq.heappop(self._heap)
+
+    def next_due(self) -> Optional[datetime]:
+        """Earliest pending deadline, or None when nothing is scheduled."""
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> List[Tuple[str, str]]:
+        """Remove and return (hierarchy, kind) for every entry due at or before now."""
+        due = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, _, hierarchy, kind, _ = heapq.heappop(self._heap)
+            due.append((hierarchy, kind))
+
+    def publish(self, simulator: 'DataSimulator', client: mqtt.Client, now: datetime) -> int:
+        """Publish every due entry and reschedule it, returning the number of updates sent."""
+        tick_start = time.perf_counter()
+        due = self.pop_due(now)
+        if not due:
+            return 0
+        sent = 0
+        for (hierarchy, kind), amount in zip(due, simulator.draw_amounts(due, now)):
+            interval = simulator.publish_due(client, simulator.active_plans[hierarchy], kind, now, amount)
+            if interval is not None:
+                self.schedule(hierarchy, kind, now + interval)
+                sent += 1
+        EVENT_TICK_SECONDS.observe(time.perf_counter() - tick_start)
+        return sent
+
+    def dispatch(self, simulator: 'DataSimulator', client: mqtt.Client, now: datetime) -> Optional[datetime]:
+        """Publish every due entry, reschedule it, and return the next publish or flush deadline."""
+        self.publish(simulator, client, now)
+        deadline = self.next_due()
+        next_flush = simulator.flush_due(now)
+        if next_flush != float('inf') and (deadline is None or next_flush < deadline.timestamp()):
+            deadline = datetime.fromtimestamp(next_flush)
+        return deadline
+
+    def wait(self, timeout: float):
+        """Sleep until timeout elapses or wake() is called."""
+        if timeout > 0:
+            self._wake.wait(timeout)
+        self._wake.clear()
+
+    def wake(self):
+        self._wake.set()
+
+class GuideSpec:
+    """data_guide row for one (hierarchy, product), resolved once at load time."""
+    __slots__ = ('hierarchy', 'product', 'site_id', 'frequency', 'freq_seconds', 'total_units',
+                 'reject_per_hr', 'key_prod', 'key_prod_hierarchy',
+                 'key_reject', 'key_reject_hierarchy')
+
+    def __init__(self, hierarchy: str, product: str, frequency: int, total_units: int,
+                 reject_per_hr: int, tag_prod: str, tag_reject: str):
+        self.hierarchy = sys.intern(hierarchy)
+        self.product = product
+        self.site_id = sys.intern(hierarchy.split("$")[0])
+        self.frequency = timedelta(minutes=frequency)
+        self.freq_seconds = frequency * 60
+        self.total_units = total_units
+        self.reject_per_hr = reject_per_hr
+        self.key_prod = f"{hierarchy}${tag_prod}"
+        self.key_prod_hierarchy = f"{hierarchy}${tag_prod}_hierarchy"
+        self.key_reject = f"{hierarchy}${tag_reject}"
+        self.key_reject_hierarchy = f"{hierarchy}${tag_reject}_hierarchy"
+
+    @staticmethod
+    def same(a: Optional['GuideSpec'], b: Optional['GuideSpec']) -> bool:
+        if a is None or b is None:
+            return a is b
+        return all(getattr(a, slot) == getattr(b, slot) for slot in GuideSpec.__slots__)
+
 class DataSimulator:
-    def __init__(self, excel_path: str, db_url: str):
+    def __init__(self, excel_path: str, db_url: Optional[str], checkpoint_path: Optional[str] = CHECKPOINT_PATH,
+                 sheets: Optional[Dict[str, pd.DataFrame]] = None, async_db: bool = DB_ASYNC,
+                 model_seed: Union[int, np.random.SeedSequence, None] = MODEL_SEED, background_refresh: bool = True):
         self.excel_path = excel_path
+        self.sheets = sheets  # parsed workbook to use instead of reading excel_path (benchmarks)
         self.db_url = db_url
         self.df_tag = None
-        self.df_guide = None
-        self.guide_map = None
+        self.tag_prod = None
+        self.tag_reject = None
+        self.guide_map: Dict[Tuple[str, str], GuideSpec] = {}
         self.last_produced_push: Dict[str, datetime] = {}
         self.last_reject_push: Dict[str, datetime] = {}
         self.produced_count: Dict[str, int] = {}
         self.active_plans: Dict[str, dict] = {}  # hierarchy -> plan dict
         self.active_plan_ids: Dict[str, int] = {}  # hierarchy -> plan id
+        self.sink: Optional[Sink] = None
+        self.batcher: Optional[MessageBatcher] = None
+        self.sink_flush_interval = SIMULATION_SINK_FLUSH_INTERVAL  # 0 leaves flushing to the sink (backfills)
+        self._next_sink_flush = 0.0  # epoch seconds
+        self.envelope = EnvelopeTemplate(get_serializer(MQTT_SERIALIZER))
+        self.checkpoints = CheckpointStore(checkpoint_path, CHECKPOINT_FLUSH_INTERVAL) if checkpoint_path else None
+        self.model: ProductionModel = create_model(PRODUCTION_MODEL, model_seed, MODEL_STOP_PROBABILITY,
+                                                   MODEL_MEAN_DOWNTIME)
+        self._pending_guide = None  # (df_tag, tag_prod, tag_reject, guide_map) staged by the guide watcher
+        self._guide_lock = threading.Lock()
+        self._guide_watch_stop = threading.Event()
+        self._guide_version: Optional[Tuple[Tuple[int, int], str]] = None  # (stat_key, digest) last read by us
         self._load_tags()
-        self.engine = create_engine(self.db_url, pool_recycle=300)
-        self.conn = self.engine.connect()  # Persistent connection
+        # Without a db_url (simulation workers) plans are pushed in via apply_active_plans
+        self.engine = get_engine(self.db_url) if db_url else None  # shared pool, a connection per refresh
+        if self.engine is not None:
+            health_check(self.engine)  # only logs; refreshes retry with backoff until the database is up
+        # Refresh queries run on db_runner (on an async engine with async_db, else the sync engine in
+        # its thread pool) and the result is applied on the loop's next call, so a slow or hung
+        # database never blocks publishing. Backfills pass background_refresh=False and wait instead.
+        background = self.engine is not None and background_refresh
+        self.async_engine = get_async_engine(self.db_url) if background and async_db else None
+        self.db_runner = AsyncRunner() if background else None
+        self._refresh_future: Optional[Future] = None
+        self._refresh_request = None  # (now, full, notified, perf_counter start) of the pending refresh
+        self._refresh_deadline = 0.0  # epoch seconds after which the pending refresh is abandoned
+        self.refresh_timeout = DB_REFRESH_TIMEOUT
+        self.backoff = Backoff()  # failed refreshes are retried at backoff.retry_at, never slept on
         self.last_plan_refresh = None
-        self.plan_refresh_interval = timedelta(minutes=1)
+        self.last_full_refresh = None
+        self.plan_refresh_interval = timedelta(seconds=PLAN_REFRESH_INTERVAL)
+        self.full_refresh_interval = timedelta(seconds=PLAN_FULL_REFRESH_INTERVAL)
+        self.next_plan_transition: Optional[datetime] = None  # earliest known plan start/end after now
+        self.max_plan_id = 0
+        self.plans_changed = threading.Event()  # set on LISTEN/NOTIFY, forces a full refresh
+        self.wake: Optional[Callable[[], None]] = None  # wakes the simulation loop (plan or guide changes)
+        self.plan_listener = None
+        if self.engine is not None and PLAN_NOTIFY_CHANNEL:
+            self.plan_listener = PlanChangeListener(self.engine, PLAN_NOTIFY_CHANNEL, self._notify_plans_changed).start()
 
     def _load_tags(self):
         """Load and validate Excel data."""
         try:
-            xls = pd.read_excel(self.excel_path, sheet_name=None)
-            self.df_tag = xls.get(SHEET_TAGS, pd.DataFrame())
-            self.df_guide = xls.get('data_guide', pd.DataFrame())
-            if self.df_tag.empty or self.df_guide.empty:
-                raise ValueError("Tags or data_guide sheet is empty or missing")
-            # Build a mapping from hierarchy to row (as dict)
-            self.guide_map = {
-                (str(row['hierarchy']).strip(), str(row['name']).strip()): row
-                for _, row in self.df_guide.iterrows()
-            }
+            if self.sheets is not None:
+                xls = self.sheets
+            else:
+                stat_key, digest, xls = WORKBOOK_CACHE.load_versioned(self.excel_path)
+                self._guide_version = (stat_key, digest)
+            self.df_tag, self.tag_prod, self.tag_reject, self.guide_map = self._read_guide(xls)
         except Exception as e:
             print(f"Error loading Excel data: {e}")
             raise
 
-    def refresh_active_plans(self):
-        now = datetime.now()
+    def _read_guide(self, xls: Dict[str, pd.DataFrame]) -> Tuple[pd.DataFrame, str, str, Dict[Tuple[str, str], GuideSpec]]:
+        df_tag = xls.get(SHEET_TAGS, pd.DataFrame())
+        df_guide = xls.get(SHEET_DATA_GUIDE, pd.DataFrame())
+        if df_tag.empty or df_guide.empty:
+            raise ValueError("Tags or data_guide sheet is empty or missing")
+        tag_prod = str(df_tag.iloc[0]['total_produced_units'])
+        tag_reject = str(df_tag.iloc[0]['reject_units'])
+        return df_tag, tag_prod, tag_reject, self._build_guide_map(df_guide, tag_prod, tag_reject)
+
+    @staticmethod
+    def _build_guide_map(df_guide: pd.DataFrame, tag_prod: str, tag_reject: str) -> Dict[Tuple[str, str], GuideSpec]:
+        """Resolve every data_guide row into a GuideSpec keyed by (hierarchy, product).
+
+        Rows with a blank or non-numeric frequency/total_units/reject_per_hr, a frequency under one
+        minute (it would publish on every loop iteration) or negative units are skipped with a warning.
+        """
+        guide_map = {}
+        numeric = ['frequency', 'total_units', 'reject_per_hr']
+        values = df_guide[numeric].apply(pd.to_numeric, errors='coerce')
+        valid = (values.notna().all(axis=1) & (values['frequency'] >= 1) & (values['total_units'] >= 0) &
+                 (values['reject_per_hr'] >= 0))
+        columns = zip(df_guide['hierarchy'], df_guide['name'], valid, values['frequency'],
+                      values['total_units'], values['reject_per_hr'])
+        for hierarchy, name, ok, frequency, total_units, reject_per_hr in columns:
+            hierarchy = str(hierarchy).strip()
+            product = str(name).strip()
+            if not ok:
+                print(f"[WARN] data_guide row for {hierarchy} and product {product} has a missing or invalid "
+                      f"{'/'.join(numeric)} (frequency must be at least 1, units not negative), skipping.")
+                continue
+            guide_map[(hierarchy, product)] = GuideSpec(
+                hierarchy, product, int(frequency), int(total_units), int(reject_per_hr), tag_prod, tag_reject
+            )
+        return guide_map
+
+    def start_guide_watch(self, interval: float):
+        """Poll the workbook every interval seconds and stage a rebuilt guide_map when it changes."""
+        threading.Thread(target=self._watch_guide, args=(interval,), name="guide-watch", daemon=True).start()
+
+    def _watch_guide(self, interval: float):
+        # Compared against the version this simulator last read, not the shared cache's: the
+        # importer may have parsed an edited workbook first, which must not hide the edit from us
+        while not self._guide_watch_stop.wait(interval):
+            try:
+                if self.sheets is not None or WORKBOOK_CACHE.stat_key(self.excel_path) == self._guide_version[0]:
+                    continue
+                stat_key, digest, xls = WORKBOOK_CACHE.load_versioned(self.excel_path)
+                changed = digest != self._guide_version[1]
+                self._guide_version = (stat_key, digest)  # a bad edit is reported once, not on every poll
+                if not changed:
+                    continue
+                staged = self._read_guide(xls)
+            except Exception as e:
+                print(f"[ERROR] Reloading data_guide failed, keeping the current one: {e}")
+                continue
+            with self._guide_lock:
+                self._pending_guide = staged
+            if self.wake is not None:
+                self.wake()
+
+    def apply_pending_guide(self) -> List[str]:
+        """Swap in a staged guide_map; returns the active hierarchies whose spec changed.
+
+        Counters and push times are keyed by hierarchy and left untouched, so unchanged
+        hierarchies carry on exactly where they were.
+        """
+        with self._guide_lock:
+            staged, self._pending_guide = self._pending_guide, None
+        if staged is None:
+            return []
+        old_specs = {hierarchy: self.guide_for(plan) for hierarchy, plan in self.active_plans.items()}
+        self.df_tag, self.tag_prod, self.tag_reject, self.guide_map = staged
+        changed = [hierarchy for hierarchy, plan in self.active_plans.items()
+                   if not GuideSpec.same(old_specs[hierarchy], self.guide_for(plan))]
+        print(f"[INFO] Reloaded data_guide ({len(self.guide_map)} entries, {len(changed)} active hierarchies changed)")
+        return changed
+
+    def _notify_plans_changed(self):
+        self.plans_changed.set()
+        if self.wake is not None:
+            self.wake()
+
+    def next_refresh_at(self, now: datetime) -> datetime:
+        """When the next plan refresh should run: the refresh interval or the next plan boundary.
+
+        While a background refresh is in flight its completion wakes the loop (or its timeout is
+        due), and after a failure nothing is due before the backoff allows a retry.
+        """
+        if self._refresh_future is not None:
+            if self._refresh_future.done():
+                return now
+            due = now + self.plan_refresh_interval
+            if self.refresh_timeout > 0:
+                due = min(due, datetime.fromtimestamp(self._refresh_deadline))
+            return due
+        if self.last_plan_refresh is None:
+            due = now
+        else:
+            due = self.last_plan_refresh + self.plan_refresh_interval
+            if self.next_plan_transition is not None and self.next_plan_transition < due:
+                due = self.next_plan_transition
+        if self.backoff.failures:
+            due = max(due, datetime.fromtimestamp(self.backoff.retry_at))
+        return due
+
+    def _refresh_timed_out(self) -> bool:
+        return self.refresh_timeout > 0 and time.time() >= self._refresh_deadline
+
+    def refresh_due(self, now: datetime) -> bool:
+        if self._refresh_future is not None:
+            return self._refresh_future.done() or self._refresh_timed_out()
+        if not self.backoff.ready():
+            return False
+        return self.plans_changed.is_set() or now >= self.next_refresh_at(now)
+
+    def refresh_active_plans(self, now: Optional[datetime] = None) -> bool:
+        """Reload active plans as of now (the current time unless a backfill passes its virtual clock).
+
+        In the background mode the first call starts the queries and returns; the call after they
+        complete applies the result. Failures, and queries still running after refresh_timeout, are
+        logged and retried after a backoff. Returns whether new plans were applied by this call.
+        """
+        if self._refresh_future is not None:
+            future = self._refresh_future
+            if not future.done():
+                if not self._refresh_timed_out():
+                    return False
+                # Abandon it: an async query is cancelled, a thread-pool one finishes into the void
+                future.cancel()
+                self._refresh_future = None
+
+                def timed_out():
+                    raise TimeoutError(f"no result after {self.refresh_timeout:g}s")
+                return self._finish_refresh(timed_out, *self._refresh_request)
+            self._refresh_future = None
+            return self._finish_refresh(future.result, *self._refresh_request)
+        if not self.backoff.ready():
+            return False
+        now = datetime.now() if now is None else now
+        notified = self.plans_changed.is_set()
+        self.plans_changed.clear()
+        full = (PLAN_REFRESH_MODE != 'incremental' or notified or self.last_full_refresh is None or
+                (now - self.last_full_refresh) >= self.full_refresh_interval)
+        args = (now, full, self.last_plan_refresh, self.max_plan_id, PLAN_REFRESH_MODE == 'incremental')
+        refresh_start = time.perf_counter()
+
+        def fetch():
+            with self.engine.connect() as conn:
+                return fetch_plans(conn, *args)
+        if self.db_runner is None:
+            return self._finish_refresh(fetch, now, full, notified, refresh_start)
+        self._refresh_request = (now, full, notified, refresh_start)
+        self._refresh_deadline = time.time() + self.refresh_timeout
+        if self.async_engine is not None:
+            self._refresh_future = self.db_runner.submit(fetch_plans_async(self.async_engine, *args))
+        else:
+            self._refresh_future = self.db_runner.submit_blocking(fetch)
+        if self.wake is not None:
+            self._refresh_future.add_done_callback(lambda _: self.wake())
+        return False
+
+    def _finish_refresh(self, fetch: Callable[[], tuple], now: datetime, full: bool, notified: bool,
+                        refresh_start: float) -> bool:
         try:
-            result = self.conn.execute(text("""
-                SELECT pp.id, pp.hierarchy, pp.product, pp.process_order, pp.start_time, pp.end_time, pp.project_id, p.name
-                FROM productionplan pp
-                JOIN product p ON pp.product = p.id
-                WHERE pp.start_time <= :now AND pp.end_time >= :now
-            """), {"now": now})
-            plans = result.mappings().fetchall()
+            plans, next_start, max_plan_id = fetch()
         except Exception as e:
-            print(f"[ERROR] DB connection lost, retrying: {e}")
-            try:
-                self.conn.close()
-            except Exception:
-                pass
-            self.engine.dispose()
-            time.sleep(2)
-            self.conn = self.engine.connect()
-            return
+            delay = self.backoff.failed()
+            print(f"[ERROR] Production plan refresh failed, retrying in {delay:.1f}s: {e}")
+            PLAN_REFRESH_ERRORS.inc()
+            if notified:
+                self.plans_changed.set()  # the notified change still needs its full refresh
+            return False
+        self.backoff.succeeded()
+        self.max_plan_id = max_plan_id
+        if full:
+            self.apply_active_plans(plans, now)
+            self.last_full_refresh = now
+            print(f"[INFO] Refreshed active production plans at {now}")
+        else:
+            self.apply_plan_changes(plans, now)
+            print(f"[INFO] Applied {len(plans)} production plan changes at {now}")
+        PLAN_REFRESH_SECONDS.labels('full' if full else 'incremental').observe(time.perf_counter() - refresh_start)
+        ACTIVE_PLANS.set(len(self.active_plans))
+        ends = [plan['end_time'] for plan in self.active_plans.values()]
+        # end_time is inclusive, so a plan stops being active just after it
+        transitions = [min(ends) + timedelta(microseconds=1)] if ends else []
+        if next_start is not None:
+            transitions.append(next_start)
+        self.next_plan_transition = min(transitions) if transitions else None
+        return True
+
+    def apply_plan_changes(self, changed: List[dict], now: datetime):
+        """Apply plans that started or ended since the last refresh on top of the active ones."""
+        plans = {hierarchy: plan for hierarchy, plan in self.active_plans.items() if plan['end_time'] >= now}
+        for plan in changed:
+            hierarchy = plan['hierarchy']
+            if plan['start_time'] <= now <= plan['end_time']:
+                plans[hierarchy] = plan
+            elif hierarchy in plans and plans[hierarchy]['id'] == plan['id']:
+                del plans[hierarchy]
+        self.apply_active_plans(list(plans.values()), now)
+
+    def apply_active_plans(self, plans: List[dict], now: datetime):
+        """Replace the active plans, resetting counters of hierarchies that got a new plan.
+
+        A new plan that was already published before a restart resumes from its checkpoint.
+        """
         new_active_plans = {}
         new_active_plan_ids = {}
         for plan in plans:
             hierarchy = plan['hierarchy']
-            product_name = plan['name']
             new_active_plans[hierarchy] = plan
             new_active_plan_ids[hierarchy] = plan['id']
             # Reset counters for hierarchies with a new plan
             if hierarchy not in self.active_plan_ids or self.active_plan_ids[hierarchy] != plan['id']:
+                checkpoint = self.checkpoints.get(plan['id'], hierarchy) if self.checkpoints is not None else None
+                if checkpoint is not None:
+                    self.produced_count[hierarchy] = checkpoint.produced_count
+                    self.last_produced_push[hierarchy] = checkpoint.last_produced_push
+                    self.last_reject_push[hierarchy] = checkpoint.last_reject_push
+                    RESUME_LOG.event('resumed', f"[INFO] Resumed {hierarchy} (plan {plan['id']}) at produced "
+                                     f"{checkpoint.produced_count}", hierarchy=hierarchy, plan_id=plan['id'],
+                                     count=checkpoint.produced_count)
+                    continue
                 self.produced_count[hierarchy] = 0
                 self.last_produced_push[hierarchy] = None
                 self.last_reject_push[hierarchy] = None
         self.active_plans = new_active_plans
         self.active_plan_ids = new_active_plan_ids
         self.last_plan_refresh = now
-        print(f"[INFO] Refreshed active production plans at {now}")
 
     @staticmethod
     def form_message(data: Dict[str, Any], timestamp: float, project_id: int, site_id: str) -> Dict[str, Any]:
@@ -138,50 +551,130 @@ class DataSimulator:
             "retain_flag": False
         }
 
-    def process_production(self, client: mqtt.Client, plan: dict, now: datetime):
-        """Process and publish production data."""
-        hierarchy = plan['hierarchy']
-        project_id = plan['project_id']
-        site_id = hierarchy.split("$")[0]
-        product_name = plan.get('name')
-        guide_row = self.guide_map.get((hierarchy, str(product_name).strip()))
-        if guide_row is not None:
-            freq_minutes = int(guide_row['frequency'])
-            actual_quant = int(guide_row['actual quant'])
-            reject_per_hr = int(guide_row['reject_per_hr'])
-            total_units = int(guide_row['total_units'])
+    def guide_for(self, plan: dict) -> Optional[GuideSpec]:
+        return self.guide_map.get((plan['hierarchy'], str(plan.get('name')).strip()))
+
+    def require_guide(self, plan: dict) -> Optional[GuideSpec]:
+        """guide_for, warning when the plan has no data_guide entry and will be skipped."""
+        spec = self.guide_for(plan)
+        if spec is None:
+            print(f"[WARN] No data_guide entry for hierarchy {plan['hierarchy']} and product {plan.get('name')}, skipping.")
+        return spec
+
+    def sink_for(self, client) -> Sink:
+        """The sink behind client: itself for file/db sinks, an MQTTSink wrapping an MQTT connection."""
+        if isinstance(client, Sink):
+            self.sink = client
+            return client
+        if not isinstance(self.sink, MQTTSink) or self.sink.client is not client:
+            self.sink = MQTTSink(client, MQTT_TOPIC, self.envelope.render)
+        return self.sink
+
+    def enable_batching(self, client: mqtt.Client):
+        """Route publishes through a MessageBatcher on client's sink."""
+        self.batcher = MessageBatcher(self.sink_for(client), MQTT_BATCH_MAX_BYTES, MQTT_BATCH_FLUSH_INTERVAL)
+
+    def send(self, client: mqtt.Client, data: Dict[str, Any], timestamp: float, project_id: int, site_id: str):
+        """Send data to client's sink right away, or queue it on the batcher when batching is enabled."""
+        if self.batcher is not None:
+            self.batcher.add(data, timestamp, project_id, site_id)
         else:
-            print(f"[WARN] No data_guide entry for hierarchy {hierarchy} and product {product_name}, skipping.")
+            send_start = time.perf_counter()
+            self.sink_for(client).send(data, timestamp, project_id, site_id)
+            PUBLISH_SECONDS.observe(time.perf_counter() - send_start)
+
+    def save_checkpoint(self, plan: dict):
+        """Stage the plan's counter and push times for the next checkpoint flush."""
+        if self.checkpoints is None:
             return
-        tag_prod = self.df_tag.iloc[0]['total_produced_units']
-        tag_reject = self.df_tag.iloc[0]['reject_units']
-        if hierarchy not in self.produced_count:
-            self.produced_count[hierarchy] = 0
-        if (self.last_produced_push.get(hierarchy) is None or
-            (now - self.last_produced_push[hierarchy]) >= timedelta(minutes=freq_minutes)):
-            self.produced_count[hierarchy] += total_units
-            data = {
-                f"{hierarchy}${tag_prod}": self.produced_count[hierarchy],
-                f"{hierarchy}${tag_prod}_hierarchy": hierarchy
-            }
-            client.publish(MQTT_TOPIC, json.dumps(self.form_message(data, now.timestamp(), project_id, site_id)))
-            print(f"📤 Produced ({self.produced_count[hierarchy]}) pushed for {hierarchy} at {now.time()}")
+        hierarchy = plan['hierarchy']
+        self.checkpoints.record(plan, self.produced_count.get(hierarchy, 0),
+                                self.last_produced_push.get(hierarchy), self.last_reject_push.get(hierarchy))
+
+    def flush_due(self, now: datetime) -> float:
+        """Flush batched messages and checkpoints that are due; returns the next flush (epoch, inf when idle)."""
+        now_ts = now.timestamp()
+        next_flush = float('inf')
+        if self.batcher is not None:
+            self.batcher.flush_due(now_ts)
+            next_flush = self.batcher.next_flush()
+        if self.checkpoints is not None:
+            self.checkpoints.flush_due(now_ts)
+            next_flush = min(next_flush, self.checkpoints.next_flush())
+        if self.sink is not None and self.sink.buffered and self.sink_flush_interval > 0:
+            if now_ts >= self._next_sink_flush:
+                self.sink.flush()
+                self._next_sink_flush = now_ts + self.sink_flush_interval
+            next_flush = min(next_flush, self._next_sink_flush)
+        return next_flush
+
+    def draw_amounts(self, due: List[Tuple[str, str]], now: datetime) -> List[Optional[int]]:
+        """Units produced/rejected for each due (hierarchy, kind), drawn from the model in one call per kind."""
+        amounts: List[Optional[int]] = [None] * len(due)
+        for kind in (PRODUCED, REJECT):
+            positions, specs = [], []
+            for pos, (hierarchy, due_kind) in enumerate(due):
+                if due_kind == kind:
+                    spec = self.guide_for(self.active_plans[hierarchy])
+                    if spec is not None:
+                        positions.append(pos)
+                        specs.append(spec)
+            if not specs:
+                continue
+            hierarchies = [spec.hierarchy for spec in specs]
+            total_units = np.fromiter((spec.total_units for spec in specs), dtype=np.int64, count=len(specs))
+            if kind == PRODUCED:
+                values = self.model.produced(hierarchies, total_units, now.timestamp())
+            else:
+                reject_per_hr = np.fromiter((spec.reject_per_hr for spec in specs), dtype=np.int64, count=len(specs))
+                freq_seconds = np.fromiter((spec.freq_seconds for spec in specs), dtype=np.float64, count=len(specs))
+                values = self.model.rejects(hierarchies, reject_per_hr, total_units, freq_seconds)
+            for pos, value in zip(positions, values.tolist()):
+                amounts[pos] = value
+        return amounts
+
+    def publish_due(self, client: mqtt.Client, plan: dict, kind: str, now: datetime,
+                    amount: Optional[int] = None) -> Optional[timedelta]:
+        """Publish one produced or reject update and return the interval until the next one.
+
+        amount is the produced/rejected units from draw_amounts; drawn here when not given.
+        """
+        hierarchy = plan['hierarchy']
+        spec = self.require_guide(plan)
+        if spec is None:
+            return None
+        if amount is None:
+            amount = self.draw_amounts([(hierarchy, kind)], now)[0]
+        if kind == PRODUCED:
+            count = self.produced_count.get(hierarchy, 0) + amount
+            self.produced_count[hierarchy] = count
+            data = {spec.key_prod: count, spec.key_prod_hierarchy: hierarchy}
+            self.send(client, data, now.timestamp(), plan['project_id'], spec.site_id)
+            UPDATES_BY_KIND[PRODUCED].inc()
+            if PUBLISH_LOG.allow():
+                PUBLISH_LOG.emit(PRODUCED, f"📤 Produced ({count}) pushed for {hierarchy} at {now.time()}",
+                                 hierarchy=hierarchy, count=count, at=now)
             self.last_produced_push[hierarchy] = now
-        if (self.last_reject_push.get(hierarchy) is None or
-            (now - self.last_reject_push[hierarchy]) >= timedelta(hours=1)):
-            data = {
-                f"{hierarchy}${tag_reject}": reject_per_hr,
-                f"{hierarchy}${tag_reject}_hierarchy": hierarchy
-            }
-            client.publish(MQTT_TOPIC, json.dumps(self.form_message(data, now.timestamp(), project_id, site_id)))
-            print(f"📤 Reject pushed for {hierarchy} at {now.time()}")
-            self.last_reject_push[hierarchy] = now
+            self.save_checkpoint(plan)
+            return spec.frequency
+        data = {spec.key_reject: amount, spec.key_reject_hierarchy: hierarchy}
+        self.send(client, data, now.timestamp(), plan['project_id'], spec.site_id)
+        UPDATES_BY_KIND[REJECT].inc()
+        if PUBLISH_LOG.allow():
+            PUBLISH_LOG.emit(REJECT, f"📤 Reject pushed for {hierarchy} at {now.time()}",
+                             hierarchy=hierarchy, count=amount, at=now)
+        self.last_reject_push[hierarchy] = now
+        self.save_checkpoint(plan)
+        return REJECT_INTERVAL
 
     def close(self):
-        try:
-            self.conn.close()
-        except Exception:
-            pass
+        self._guide_watch_stop.set()
+        if self.plan_listener is not None:
+            self.plan_listener.stop()
+        if self.checkpoints is not None:
+            self.checkpoints.close()
+        if self.db_runner is not None:
+            self.db_runner.stop()
 
 def data_simulation():
     """Main function to run the data simulation."""
@@ -189,18 +682,30 @@ def data_simulation():
     
     simulator = None
     try:
-        mqtt_client = MQTTClient(MQTT_BROKER, MQTT_PORT)
+        mqtt_client = create_output()
         simulator = DataSimulator(EXCEL_FILE_PATH, DB_URL)
+        start_metrics_server(METRICS_PORT, METRICS_HOST)
 
         with mqtt_client.connection() as client:
-            while True:
+            scheduler = ProductionScheduler()
+            simulator.wake = scheduler.wake
+            on_shutdown(scheduler.wake)
+            simulator.sink_for(client)
+            if MQTT_BATCH_ENABLED:
+                simulator.enable_batching(client)
+            if GUIDE_RELOAD_INTERVAL > 0:
+                simulator.start_guide_watch(GUIDE_RELOAD_INTERVAL)
+            while not SHUTDOWN.is_set():
                 now = datetime.now()
-                if (simulator.last_plan_refresh is None or
-                    (now - simulator.last_plan_refresh) >= simulator.plan_refresh_interval):
-                    simulator.refresh_active_plans()
-                for hierarchy, plan in simulator.active_plans.items():
-                    simulator.process_production(client, plan, now)
-                time.sleep(5)
+                if simulator.refresh_due(now) and simulator.refresh_active_plans():
+                    scheduler.sync_plans(simulator, now)
+                scheduler.reschedule(simulator, simulator.apply_pending_guide(), now)
+                deadline = scheduler.dispatch(simulator, client, now)
+                next_refresh = simulator.next_refresh_at(now)
+                deadline = next_refresh if deadline is None else min(deadline, next_refresh)
+                scheduler.wait((deadline - datetime.now()).total_seconds())
+            if simulator.batcher is not None:
+                simulator.batcher.flush()
 
     except KeyboardInterrupt:
         print("🛑 User stopped.")
@@ -0,0 +1,134 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Coroutine, Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import InvalidRequestError
+from config import (DB_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_CONNECT_TIMEOUT,
+                    DB_STATEMENT_TIMEOUT)
+
+_engines: Dict[str, Engine] = {}
+_async_engines: Dict[str, object] = {}
+_lock = threading.Lock()
+
+def get_engine(url: str = DB_URL) -> Engine:
+    """Process-wide engine for url, shared by the simulator, plan listener and importer.
+
+    Connections are checked with a pre-ping when taken from the pool, so a dropped
+    connection costs one failed round trip instead of a failed query. On Postgres, connect
+    and statement timeouts turn a hung server into an error instead of a wait.
+    """
+    url = str(url)
+    with _lock:
+        engine = _engines.get(url)
+        if engine is None:
+            options = {'pool_pre_ping': True, 'pool_recycle': DB_POOL_RECYCLE}
+            backend = make_url(url).get_backend_name()
+            if backend != 'sqlite':
+                options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+            if backend == 'postgresql':
+                connect_args = {}
+                if DB_CONNECT_TIMEOUT > 0:
+                    connect_args['connect_timeout'] = DB_CONNECT_TIMEOUT
+                if DB_STATEMENT_TIMEOUT > 0:
+                    connect_args['options'] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT * 1000}"
+                options['connect_args'] = connect_args
+            engine = _engines[url] = create_engine(url, **options)
+        return engine
+
+def health_check(engine: Engine) -> bool:
+    """True if a pooled connection can run SELECT 1."""
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except Exception as e:
+        print(f"[WARN] Database health check failed: {e}")
+        return False
+
+class Backoff:
+    """Exponential backoff with jitter, tracked as a retry time instead of a sleep.
+
+    Callers check ready() on their own loop, so a failing database delays only the work
+    that needs it and never blocks the thread.
+    """
+
+    def __init__(self, initial: float = 1.0, maximum: float = 60.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.failures = 0
+        self.retry_at = 0.0  # epoch seconds
+
+    def failed(self, now_ts: Optional[float] = None) -> float:
+        """Record a failure and return the delay until the next attempt."""
+        now_ts = time.time() if now_ts is None else now_ts
+        delay = min(self.maximum, self.initial * 2 ** self.failures) * random.uniform(0.5, 1.0)
+        self.failures += 1
+        self.retry_at = now_ts + delay
+        return delay
+
+    def succeeded(self):
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def ready(self, now_ts: Optional[float] = None) -> bool:
+        return (time.time() if now_ts is None else now_ts) >= self.retry_at
+
+def get_async_engine(url: str = DB_URL):
+    """SQLAlchemy async engine for url, using asyncpg for Postgres and aiosqlite for SQLite URLs.
+
+    asyncpg gets the same connect and statement timeouts as the sync Postgres engine.
+
+    Optional: needs the async driver package, which is not in requirements.txt.
+    """
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+    except ImportError as e:
+        raise ValueError(f"DB_ASYNC needs SQLAlchemy's asyncio extension: {e}")
+    parsed = make_url(str(url))
+    if parsed.get_backend_name() == 'postgresql' and parsed.get_driver_name() == 'psycopg2':
+        parsed = parsed.set(drivername='postgresql+asyncpg')
+    elif parsed.get_backend_name() == 'sqlite' and parsed.get_driver_name() == 'pysqlite':
+        parsed = parsed.set(drivername='sqlite+aiosqlite')
+    key = parsed.render_as_string(hide_password=False)
+    with _lock:
+        engine = _async_engines.get(key)
+        if engine is None:
+            options = {'pool_pre_ping': True, 'pool_recycle': DB_POOL_RECYCLE}
+            if parsed.get_driver_name() == 'asyncpg':
+                connect_args = {}
+                if DB_CONNECT_TIMEOUT > 0:
+                    connect_args['timeout'] = DB_CONNECT_TIMEOUT
+                if DB_STATEMENT_TIMEOUT > 0:
+                    connect_args['command_timeout'] = DB_STATEMENT_TIMEOUT
+                options['connect_args'] = connect_args
+            try:
+                engine = create_async_engine(parsed, **options)
+            except (ImportError, InvalidRequestError) as e:
+                raise ValueError(f"DB_ASYNC needs an async driver (asyncpg, aiosqlite) for {parsed.drivername}: {e}")
+            _async_engines[key] = engine
+        return engine
+
+class AsyncRunner:
+    """asyncio loop on a daemon thread; submit() runs a coroutine there and returns a Future."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="db-async", daemon=True).start()
+
+    def submit(self, coro: Coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def submit_blocking(self, fn: Callable, *args) -> Future:
+        """Run a blocking fn on the loop's default executor, so sync drivers stay off the caller's thread."""
+        return self.submit(self._in_executor(fn, *args))
+
+    @staticmethod
+    async def _in_executor(fn: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
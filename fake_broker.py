@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import threading
+import time
+from collections import Counter
+from typing import List, Tuple
+
+class FakeBroker:
+    """Minimal in-process MQTT 3.1.1 broker for local runs and benchmarks.
+
+    Accepts CONNECT, PUBLISH (QoS 0/1), PINGREQ and DISCONNECT. Published
+    messages are recorded per connection instead of being routed to subscribers.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, ack_delay: float = 0.0, keep_messages: bool = True):
+        self.host = host
+        self.port = port
+        self.ack_delay = ack_delay
+        self.keep_messages = keep_messages
+        self.messages: List[Tuple[int, str, bytes]] = []  # (connection number, topic, payload)
+        self.per_connection = Counter()  # connection number -> messages received
+        self.received = 0
+        self.loop = None
+        self._server = None
+        self._connections = 0
+
+    @staticmethod
+    async def _read_packet(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+        header = (await reader.readexactly(1))[0]
+        multiplier, length = 1, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 127) * multiplier
+            multiplier *= 128
+            if not byte & 128:
+                break
+        return header, await reader.readexactly(length)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections += 1
+        conn = self._connections
+        try:
+            while True:
+                header, body = await self._read_packet(reader)
+                packet_type = header >> 4
+                if packet_type == 1:  # CONNECT
+                    writer.write(b'\x20\x02\x00\x00')
+                elif packet_type == 3:  # PUBLISH
+                    qos = (header >> 1) & 3
+                    topic_len = int.from_bytes(body[:2], 'big')
+                    topic = body[2:2 + topic_len].decode()
+                    pos = 2 + topic_len
+                    if qos:
+                        mid = body[pos:pos + 2]
+                        pos += 2
+                        if self.ack_delay:
+                            await asyncio.sleep(self.ack_delay)
+                        writer.write(b'\x40\x02' + mid)
+                    self.received += 1
+                    self.per_connection[conn] += 1
+                    if self.keep_messages:
+                        self.messages.append((conn, topic, body[pos:]))
+                elif packet_type == 12:  # PINGREQ
+                    writer.write(b'\xd0\x00')
+                elif packet_type == 14:  # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def start(self) -> 'FakeBroker':
+        """Serve on a background thread; self.port holds the bound port once this returns."""
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            self.loop.run_until_complete(self._serve())
+            ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, name="fake-broker", daemon=True).start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self._server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake MQTT broker and print the receive rate.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--ack-delay', type=float, default=0.0, help="seconds to delay each PUBACK")
+    args = parser.parse_args()
+    broker = FakeBroker(args.host, args.port, args.ack_delay, keep_messages=False).start()
+    print(f"Fake MQTT broker listening on {broker.host}:{broker.port}")
+    last = 0
+    try:
+        while True:
+            time.sleep(5)
+            print(f"  {(broker.received - last) / 5:,.0f} msg/s, per connection: {dict(broker.per_connection)}")
+            last = broker.received
+    except KeyboardInterrupt:
+        broker.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter as TallyCounter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+# Seconds; spans sub-millisecond ticks up to slow DB refreshes.
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Metric:
+    """Base of Counter/Gauge/Histogram; labels(...) returns the child for one label combination."""
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._children: Dict[Tuple[str, ...], 'Metric'] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> 'Metric':
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self) -> 'Metric':
+        raise NotImplementedError
+
+    def _samples(self, names: Tuple[str, ...], values: Tuple[str, ...]) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.labelnames:
+            for values, child in list(self._children.items()):
+                lines.extend(child._samples(self.labelnames, values))
+        else:
+            lines.extend(self._samples((), ()))
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self.value = 0
+
+    def _new_child(self) -> 'Counter':
+        return Counter(self.name, self.help)
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def _samples(self, names: Tuple[str, ...], values: Tuple[str, ...]) -> List[str]:
+        return [f"{self.name}{_format_labels(names, values)} {self.value}"]
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def _new_child(self) -> 'Gauge':
+        return Gauge(self.name, self.help)
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def _new_child(self) -> 'Histogram':
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value: float):
+        bucket = bisect.bisect_left(self.buckets, value)
+        # Observed from several threads at once (e.g. the ack callbacks of every MQTT pool member)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def _samples(self, names: Tuple[str, ...], values: Tuple[str, ...]) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+            lines.append(f"{self.name}_bucket{_format_labels(names, values, le)} {cumulative}")
+        labels = _format_labels(names, values)
+        lines.append(f"{self.name}_sum{labels} {self.sum}")
+        lines.append(f"{self.name}_count{labels} {self.count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+TICK_SECONDS = REGISTRY.register(Histogram(
+    'simulator_tick_seconds', 'Time to publish everything due in one loop iteration', ('engine',)))
+UPDATES = REGISTRY.register(Counter(
+    'simulator_updates_total', 'Produced/reject updates generated', ('kind',)))
+ACTIVE_PLANS = REGISTRY.register(Gauge(
+    'simulator_active_plans', 'Production plans currently simulated'))
+PUBLISH_SECONDS = REGISTRY.register(Histogram(
+    'simulator_publish_seconds', 'Time spent handing one message to the sink'))
+MQTT_ACK_SECONDS = REGISTRY.register(Histogram(
+    'mqtt_ack_seconds', 'Publish to broker ack latency of the asyncio transport'))
+PLAN_REFRESH_SECONDS = REGISTRY.register(Histogram(
+    'plan_refresh_seconds', 'Duration of production plan refreshes', ('mode',)))
+PLAN_REFRESH_ERRORS = REGISTRY.register(Counter(
+    'plan_refresh_errors_total', 'Failed production plan refreshes'))
+IMPORTER_PHASE_SECONDS = REGISTRY.register(Histogram(
+    'importer_phase_seconds', 'Duration of productionplan import phases', ('phase',)))
+
+class RateLimitedLog:
+    """print() at most max_per_sec lines per second; the rest are counted and summarized.
+
+    Used for per-publish lines, which are fine with a handful of hierarchies but dominate
+    the loop at scale. With log_format 'json' event() prints one JSON record per line
+    (ts, event and its fields) instead of the human-readable message.
+    """
+
+    def __init__(self, max_per_sec: float, log_format: str = 'text'):
+        self.max_per_sec = max_per_sec
+        self.json = log_format == 'json'
+        self._window_start = time.monotonic()
+        self._printed = 0
+        self._suppressed = 0
+
+    def allow(self) -> bool:
+        """Whether one more line may be printed now; hot paths check this before formatting."""
+        if self.max_per_sec <= 0:
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            if self._suppressed:
+                self.emit('log_suppressed',
+                          f"[INFO] {self._suppressed} log lines suppressed in the last {now - self._window_start:.1f}s",
+                          count=self._suppressed, seconds=round(now - self._window_start, 1))
+            self._window_start = now
+            self._printed = 0
+            self._suppressed = 0
+        if self._printed < self.max_per_sec:
+            self._printed += 1
+            return True
+        self._suppressed += 1
+        return False
+
+    def emit(self, event: str, message: str, **fields):
+        """Print one event without the rate check (callers on hot paths check allow() first)."""
+        if self.json:
+            print(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
+        else:
+            print(message)
+
+    def event(self, event: str, message: str, **fields):
+        if self.allow():
+            self.emit(event, message, **fields)
+
+class SamplingProfiler:
+    """Samples the stacks of all other threads every interval seconds while running.
+
+    Unlike cProfile it needs no cooperation from the simulation thread, so it can be
+    switched on and off from the metrics endpoint without restarting. Threads blocked
+    in a wait or select are skipped so idle helpers do not drown out the busy ones.
+    """
+    IDLE = {('wait', 'threading.py'), ('_wait_for_tstate_lock', 'threading.py'),
+            ('select', 'selectors.py'), ('select', 'select.py'), ('get', 'queue.py')}
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = 0
+        self.leaf = TallyCounter()  # (function, file, line) -> samples where it was running
+        self.inclusive = TallyCounter()  # (function, file) -> samples where it was on the stack
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.samples = 0
+        self.leaf.clear()
+        self.inclusive.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.report()
+
+    def _run(self):
+        own = {threading.get_ident()}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in own:
+                    continue
+                code = frame.f_code
+                if (code.co_name, os.path.basename(code.co_filename)) in self.IDLE:
+                    continue
+                self.leaf[(code.co_name, code.co_filename, frame.f_lineno)] += 1
+                seen = set()
+                while frame is not None:
+                    key = (frame.f_code.co_name, frame.f_code.co_filename)
+                    if key not in seen:
+                        seen.add(key)
+                        self.inclusive[key] += 1
+                    frame = frame.f_back
+            self.samples += 1
+
+    def report(self, top: int = 25) -> str:
+        if not self.samples:
+            return "No samples collected\n"
+        lines = [f"{self.samples} samples every {self.interval * 1000:.1f} ms", "", "Self (running):"]
+        for (name, filename, line), count in self.leaf.most_common(top):
+            lines.append(f"  {count:>7}  {name} ({os.path.basename(filename)}:{line})")
+        lines += ["", "Inclusive (on stack):"]
+        for (name, filename), count in self.inclusive.most_common(top):
+            lines.append(f"  {count:>7}  {name} ({os.path.basename(filename)})")
+        return '\n'.join(lines) + '\n'
+
+PROFILER = SamplingProfiler()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics (Prometheus text), /profile/start, /profile/stop and /profile (last report)."""
+    last_report = "Profiler has not been run\n"
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._reply(200, REGISTRY.render(), 'text/plain; version=0.0.4')
+        elif self.path == '/profile/start':
+            PROFILER.start()
+            self._reply(200, "Profiler started\n")
+        elif self.path == '/profile/stop':
+            MetricsHandler.last_report = PROFILER.stop()
+            self._reply(200, MetricsHandler.last_report)
+        elif self.path == '/profile':
+            self._reply(200, PROFILER.report() if PROFILER.running else MetricsHandler.last_report)
+        else:
+            self._reply(404, "Not found\n")
+
+    def _reply(self, status: int, body: str, content_type: str = 'text/plain'):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would flood stdout
+
+def start_metrics_server(port: int, host: str = '127.0.0.1') -> Optional[ThreadingHTTPServer]:
+    """Serve metrics on host:port in a daemon thread; port 0 disables it.
+
+    Local only by default, since GET /profile/start and /profile/stop change state.
+    """
+    if port <= 0:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f"[WARN] Metrics endpoint not started on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[INFO] Metrics on http://{host}:{port}/metrics")
+    return server
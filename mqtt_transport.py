@@ -0,0 +1,248 @@
+import asyncio
+import threading
+import time
+import zlib
+from collections import deque
+from contextlib import contextmanager, ExitStack
+from typing import Dict, Any, Callable
+import paho.mqtt.client as mqtt
+from metrics import MQTT_ACK_SECONDS
+
+class PublishMetrics:
+    """Counters and recent ack latencies of a transport."""
+
+    def __init__(self, window: int = 10000):
+        self.published = 0
+        self.acked = 0
+        self.max_queue_depth = 0
+        self.latencies = deque(maxlen=window)  # seconds from publish to broker ack
+
+    def observe_ack(self, latency: float):
+        self.acked += 1
+        self.latencies.append(latency)
+
+    def snapshot(self, queue_depth: int, in_flight: int) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        return {
+            "queue_depth": queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": in_flight,
+            "published": self.published,
+            "acked": self.acked,
+            "latency_p50_ms": percentile(0.50),
+            "latency_p99_ms": percentile(0.99),
+            "latency_max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        }
+
+class AsyncMQTTTransport:
+    """paho client driven by an asyncio loop, with a bounded outbound queue and ack tracking.
+
+    The loop runs in a background thread and owns all socket I/O (paho's external
+    event loop hooks). publish() blocks the calling thread while the outbound queue
+    is full, and at most max_inflight messages are awaiting a broker ack at once.
+    """
+
+    def __init__(self, broker: str, port: int, qos: int = 1, max_inflight: int = 100,
+                 queue_size: int = 10000, metrics_interval: float = 60.0, drain_timeout: float = 10.0):
+        self.client = mqtt.Client(protocol=mqtt.MQTTv311)
+        self.broker = broker
+        self.port = port
+        self.qos = qos
+        self.max_inflight = max_inflight
+        self.queue_size = queue_size
+        self.metrics_interval = metrics_interval
+        self.drain_timeout = drain_timeout
+        self.metrics = PublishMetrics()
+        self.loop = None
+        self._thread = None
+        self._queue = None
+        self._inflight_slots = None
+        self._capacity = threading.BoundedSemaphore(queue_size)
+        self._queued = 0
+        self._queued_lock = threading.Lock()
+        self._sent: Dict[int, float] = {}  # mid -> time.perf_counter() at publish
+        self._closing = False
+        self._tasks = []
+        self._setup_client()
+
+    def _setup_client(self):
+        """Setup MQTT client with error handling and callbacks."""
+        try:
+            self.client.max_inflight_messages_set(self.max_inflight)
+            self.client.on_connect = self._on_connect
+            self.client.on_disconnect = self._on_disconnect
+            self.client.on_publish = self._on_publish
+            self.client.on_socket_open = self._on_socket_open
+            self.client.on_socket_close = self._on_socket_close
+            self.client.on_socket_register_write = self._on_socket_register_write
+            self.client.on_socket_unregister_write = self._on_socket_unregister_write
+        except Exception as e:
+            print(f"Error setting up MQTT client: {e}")
+            raise
+
+    def _on_connect(self, client, userdata, flags, rc):
+        """Callback for when the client connects to the broker."""
+        if rc == 0:
+            print("Connected to MQTT broker (asyncio transport)")
+        else:
+            print(f"Failed to connect to MQTT broker with code: {rc}")
+
+    def _on_disconnect(self, client, userdata, rc):
+        """Callback for when the client disconnects from the broker."""
+        if rc != 0:
+            print(f"Unexpected disconnection from MQTT broker with code: {rc}")
+
+    def _on_publish(self, client, userdata, mid):
+        """Callback for when the broker acknowledged a message (runs on the loop thread)."""
+        sent_at = self._sent.pop(mid, None)
+        if sent_at is None:
+            return
+        latency = time.perf_counter() - sent_at
+        self.metrics.observe_ack(latency)
+        MQTT_ACK_SECONDS.observe(latency)
+        self._inflight_slots.release()
+
+    def _on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def _start(self):
+        self._queue = asyncio.Queue()
+        self._inflight_slots = asyncio.Semaphore(self.max_inflight)
+        self.client.connect(self.broker, self.port, 60)
+        self._tasks = [self.loop.create_task(self._misc_loop()), self.loop.create_task(self._sender())]
+
+    async def _misc_loop(self):
+        """Keepalives, reconnects with backoff and periodic metrics."""
+        backoff = 1.0
+        last_report = time.monotonic()
+        while not self._closing:
+            if self.client.loop_misc() == mqtt.MQTT_ERR_NO_CONN:
+                try:
+                    self.client.reconnect()
+                    backoff = 1.0
+                except Exception as e:
+                    print(f"[WARN] MQTT reconnect failed, retrying in {backoff:.0f}s: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60.0)
+                    continue
+            if self.metrics_interval and time.monotonic() - last_report >= self.metrics_interval:
+                last_report = time.monotonic()
+                print(f"[INFO] MQTT transport metrics: {self.snapshot()}")
+            await asyncio.sleep(1)
+
+    async def _sender(self):
+        """Move queued messages to paho, waiting for an in-flight slot before each one."""
+        while True:
+            topic, payload = await self._queue.get()
+            await self._inflight_slots.acquire()
+            info = self.client.publish(topic, payload, qos=self.qos)
+            self.metrics.published += 1
+            with self._queued_lock:
+                self._queued -= 1
+            self._capacity.release()
+            if self.qos == 0:
+                self._inflight_slots.release()
+            else:
+                self._sent[info.mid] = time.perf_counter()
+            self._queue.task_done()
+
+    def publish(self, topic: str, payload=None, qos: int = None, retain: bool = False):
+        """Queue a message, blocking while the outbound queue is full (backpressure).
+
+        qos and retain are accepted for paho compatibility; the transport's qos is used.
+        """
+        self._capacity.acquire()
+        with self._queued_lock:
+            self._queued += 1
+            if self._queued > self.metrics.max_queue_depth:
+                self.metrics.max_queue_depth = self._queued
+        self.loop.call_soon_threadsafe(self._queue.put_nowait, (topic, payload))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current queue depth, in-flight count and publish latency percentiles."""
+        return self.metrics.snapshot(self._queued, len(self._sent))
+
+    async def _drain(self):
+        await self._queue.join()
+        while self._sent:
+            await asyncio.sleep(0.05)
+
+    async def _stop(self):
+        try:
+            await asyncio.wait_for(self._drain(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"[WARN] MQTT transport closed with {self._queued} queued and {len(self._sent)} unacked messages")
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        self.client.disconnect()
+
+    @contextmanager
+    def connection(self):
+        """Context manager for the MQTT connection; yields the transport itself."""
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="mqtt-asyncio", daemon=True)
+        self._thread.start()
+        try:
+            asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+            yield self
+        finally:
+            try:
+                asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result()
+            finally:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self._thread.join()
+                self.loop.close()
+
+class MQTTClientPool:
+    """N MQTT connections with hierarchies sharded across them by site id.
+
+    A site always maps to the same connection (crc32, stable across processes),
+    so messages of one hierarchy keep their order while load spreads over the pool.
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int):
+        if size < 1:
+            raise ValueError("MQTT pool size must be at least 1")
+        self.members = [factory() for _ in range(size)]
+        self.clients = []
+        self._shards: Dict[str, Any] = {}  # site_id -> connected client
+
+    @staticmethod
+    def shard_index(site_id: str, size: int) -> int:
+        return zlib.crc32(site_id.encode()) % size
+
+    def client_for(self, site_id: str):
+        """Connected client that owns site_id."""
+        client = self._shards.get(site_id)
+        if client is None:
+            client = self._shards[site_id] = self.clients[self.shard_index(site_id, len(self.clients))]
+        return client
+
+    def publish(self, topic: str, payload=None, qos: int = 0, retain: bool = False):
+        """Publish on the first connection, for messages that belong to no site."""
+        return self.clients[0].publish(topic, payload, qos=qos, retain=retain)
+
+    @contextmanager
+    def connection(self):
+        """Open every member connection; yields the pool itself."""
+        with ExitStack() as stack:
+            self.clients = [stack.enter_context(member.connection()) for member in self.members]
+            self._shards = {}
+            print(f"[INFO] MQTT pool connected with {len(self.clients)} connections")
+            yield self
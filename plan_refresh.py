@@ -0,0 +1,120 @@
+import select
+import threading
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import text, DateTime
+
+PLAN_COLUMNS = """
+    SELECT pp.id, pp.hierarchy, pp.product, pp.process_order, pp.start_time, pp.end_time, pp.project_id, p.name
+    FROM productionplan pp
+    JOIN product p ON pp.product = p.id
+"""
+
+ACTIVE_PLANS_SQL = text(PLAN_COLUMNS + """
+    WHERE pp.start_time <= :now AND pp.end_time >= :now
+""").columns(start_time=DateTime, end_time=DateTime)
+
+# Plans that started or ended since the last refresh, plus rows inserted since then
+# that are already running (start_time in the past when they were added).
+CHANGED_PLANS_SQL = text(PLAN_COLUMNS + """
+    WHERE (pp.start_time > :since AND pp.start_time <= :now)
+       OR (pp.end_time >= :since AND pp.end_time < :now)
+       OR (pp.id > :max_id AND pp.start_time <= :now AND pp.end_time >= :now)
+""").columns(start_time=DateTime, end_time=DateTime)
+
+NEXT_PLAN_START_SQL = text("""
+    SELECT MIN(start_time) AS next_start FROM productionplan WHERE start_time > :now
+""").columns(next_start=DateTime)
+
+MAX_PLAN_ID_SQL = text("SELECT MAX(id) FROM productionplan")
+
+def query_active_plans(conn, now: datetime) -> List[dict]:
+    """Production plans active at now, as plain (picklable) dicts."""
+    result = conn.execute(ACTIVE_PLANS_SQL, {"now": now})
+    return [dict(plan) for plan in result.mappings().fetchall()]
+
+def query_changed_plans(conn, since: datetime, now: datetime, max_id: int) -> List[dict]:
+    """Plans whose start/end boundary fell in (since, now], or new active rows with id > max_id."""
+    result = conn.execute(CHANGED_PLANS_SQL, {"since": since, "now": now, "max_id": max_id})
+    return [dict(plan) for plan in result.mappings().fetchall()]
+
+def query_next_plan_start(conn, now: datetime) -> Optional[datetime]:
+    return conn.execute(NEXT_PLAN_START_SQL, {"now": now}).scalar()
+
+def query_max_plan_id(conn) -> int:
+    return conn.execute(MAX_PLAN_ID_SQL).scalar() or 0
+
+def fetch_plans(conn, now: datetime, full: bool, since: Optional[datetime], max_id: int,
+                incremental: bool) -> Tuple[List[dict], Optional[datetime], int]:
+    """All reads of one refresh: (active or changed plans, next plan start, current max plan id)."""
+    # Read the max id first so rows inserted during this refresh are caught by the next one
+    new_max_id = query_max_plan_id(conn) if incremental else 0
+    plans = query_active_plans(conn, now) if full else query_changed_plans(conn, since, now, max_id)
+    return plans, query_next_plan_start(conn, now), new_max_id
+
+async def fetch_plans_async(engine, *args) -> Tuple[List[dict], Optional[datetime], int]:
+    """fetch_plans on a pooled connection of an async engine (same queries, awaited I/O)."""
+    async with engine.connect() as conn:
+        return await conn.run_sync(fetch_plans, *args)
+
+class PlanChangeListener:
+    """Background LISTEN on a Postgres channel, calling on_notify for every notification.
+
+    The channel has to be fed by a trigger on productionplan, for example:
+
+        CREATE OR REPLACE FUNCTION notify_productionplan_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('productionplan_changed', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER productionplan_changed
+        AFTER INSERT OR UPDATE OR DELETE ON productionplan
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_productionplan_changed();
+    """
+
+    def __init__(self, engine, channel: str, on_notify: Callable[[], None]):
+        self.engine = engine
+        self.channel = channel
+        self.on_notify = on_notify
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="plan-listener", daemon=True)
+
+    def start(self) -> 'PlanChangeListener':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _listen(self):
+        raw = self.engine.raw_connection()
+        dbapi_conn = raw.driver_connection
+        dbapi_conn.autocommit = True
+        with dbapi_conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        print(f"[INFO] Listening for production plan changes on '{self.channel}'")
+        return raw, dbapi_conn
+
+    def _run(self):
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw, dbapi_conn = self._listen()
+                while not self._stop.is_set():
+                    if select.select([dbapi_conn], [], [], 5.0) == ([], [], []):
+                        continue
+                    dbapi_conn.poll()
+                    if dbapi_conn.notifies:
+                        dbapi_conn.notifies.clear()
+                        self.on_notify()
+            except Exception as e:
+                print(f"[ERROR] Plan change listener failed, reconnecting: {e}")
+                self._stop.wait(5.0)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.invalidate()
+                    except Exception:
+                        pass
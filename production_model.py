@@ -0,0 +1,108 @@
+from typing import Dict, Optional, Sequence, Union
+import numpy as np
+
+class ProductionModel:
+    """Decides how many units each due hierarchy produced and rejected, for many hierarchies at once."""
+    name = ''
+
+    def produced(self, hierarchies: Sequence[str], total_units: np.ndarray, now_ts: float) -> np.ndarray:
+        """Units produced in the last frequency interval by each of hierarchies."""
+        raise NotImplementedError
+
+    def rejects(self, hierarchies: Sequence[str], reject_per_hr: np.ndarray, total_units: np.ndarray,
+                freq_seconds: np.ndarray) -> np.ndarray:
+        """Units rejected in the last hour by each of hierarchies."""
+        raise NotImplementedError
+
+class FixedModel(ProductionModel):
+    """data_guide values as they are: total_units every frequency, reject_per_hr every hour."""
+    name = 'fixed'
+
+    def produced(self, hierarchies, total_units, now_ts):
+        return total_units
+
+    def rejects(self, hierarchies, reject_per_hr, total_units, freq_seconds):
+        return reject_per_hr
+
+class StochasticModel(ProductionModel):
+    """Poisson output with random micro-stops and rejects proportional to what was produced.
+
+    Each frequency interval a running line produces Poisson(total_units) units. With
+    stop_probability it stops somewhere in that interval, losing the rest of it, and
+    stays down for an exponential time with mean mean_downtime seconds. Hourly rejects
+    are Binomial(units produced since the last reject push, reject rate), where the rate
+    is reject_per_hr over the nominal hourly output, so rejects follow throughput.
+
+    All draws for a tick come from one seeded Generator call per quantity, so runs
+    with the same seed and the same due order are reproducible.
+    """
+    name = 'stochastic'
+
+    def __init__(self, seed: Union[int, np.random.SeedSequence, None], stop_probability: float = 0.02,
+                 mean_downtime: float = 600.0):
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.stop_probability = stop_probability
+        self.mean_downtime = mean_downtime
+        self._slots: Dict[str, int] = {}  # hierarchy -> index into the state arrays
+        self.down_until = np.zeros(0, dtype=np.float64)  # epoch seconds the line is stopped until
+        self.since_reject = np.zeros(0, dtype=np.int64)  # units produced since the last reject push
+
+    def _slots_for(self, hierarchies: Sequence[str]) -> np.ndarray:
+        slots = self._slots
+        for hierarchy in hierarchies:
+            if hierarchy not in slots:
+                slots[hierarchy] = len(slots)
+        if len(slots) > len(self.down_until):
+            grow = max(len(slots), 2 * len(self.down_until)) - len(self.down_until)
+            self.down_until = np.concatenate([self.down_until, np.zeros(grow)])
+            self.since_reject = np.concatenate([self.since_reject, np.zeros(grow, dtype=np.int64)])
+        return np.fromiter((slots[hierarchy] for hierarchy in hierarchies), dtype=np.int64, count=len(hierarchies))
+
+    def produced(self, hierarchies, total_units, now_ts):
+        slots = self._slots_for(hierarchies)
+        n = len(slots)
+        units = self.rng.poisson(np.asarray(total_units, dtype=np.float64))
+        units[self.down_until[slots] > now_ts] = 0
+        stops = np.flatnonzero((units > 0) & (self.rng.random(n) < self.stop_probability))
+        if len(stops):
+            # Stopped part way through the interval: keep the share produced before the stop
+            units[stops] = (units[stops] * self.rng.random(len(stops))).astype(np.int64)
+            self.down_until[slots[stops]] = now_ts + self.rng.exponential(self.mean_downtime, len(stops))
+        self.since_reject[slots] += units
+        return units
+
+    def rejects(self, hierarchies, reject_per_hr, total_units, freq_seconds):
+        slots = self._slots_for(hierarchies)
+        freq_seconds = np.asarray(freq_seconds, dtype=np.float64)
+        nominal_per_hr = np.asarray(total_units, dtype=np.float64) * 3600.0 / freq_seconds
+        rate = np.clip(np.asarray(reject_per_hr, dtype=np.float64) / np.maximum(nominal_per_hr, 1.0), 0.0, 1.0)
+        rejects = self.rng.binomial(self.since_reject[slots], rate)
+        self.since_reject[slots] = 0
+        return rejects
+
+def worker_seed(seed: Optional[int], index: int, generation: int = 0) -> Optional[np.random.SeedSequence]:
+    """Independent, reproducible stream for worker index, and for each restart (generation) of it.
+
+    Workers sharing MODEL_SEED would otherwise draw identical micro-stops and outputs, and a
+    restarted worker would replay the draws it already made.
+    """
+    if seed is None:
+        return None  # each process draws (and logs) its own random seed
+    return np.random.SeedSequence(seed, spawn_key=(index, generation))
+
+def create_model(name: str, seed: Union[int, np.random.SeedSequence, None] = None, stop_probability: float = 0.02,
+                 mean_downtime: float = 600.0) -> ProductionModel:
+    name = name.strip().lower()
+    if name == 'fixed':
+        return FixedModel()
+    if name == 'stochastic':
+        model = StochasticModel(seed, stop_probability, mean_downtime)
+        if isinstance(model.seed, np.random.SeedSequence):
+            print(f"[INFO] Stochastic production model, seed {model.seed.entropy} spawn key {model.seed.spawn_key}")
+        else:
+            print(f"[INFO] Stochastic production model, seed {model.seed}")
+        return model
+    raise ValueError(f"Unknown production model '{name}', expected fixed or stochastic")
@@ -1,27 +1,147 @@
 import pandas as pd
-from sqlalchemy import text , create_engine
+from sqlalchemy import text , table, column, insert
 from datetime import datetime, timedelta
-from config import EXCEL_FILE_PATH, SHEET_DATA_GUIDE ,DB_URL
+from typing import Dict, Any, List, Optional, Tuple
+from config import EXCEL_FILE_PATH, SHEET_DATA_GUIDE, LOG_MAX_LINES_PER_SEC, LOG_FORMAT
+from db import get_engine, health_check
+from workbook_cache import load_workbook
+from metrics import IMPORTER_PHASE_SECONDS, RateLimitedLog
 
-def import_productionplan():
-    def get_engine():
-        return create_engine(DB_URL, pool_recycle=300)
-    engine = get_engine()
-    connection = engine.connect()
-    xls = pd.read_excel(EXCEL_FILE_PATH, sheet_name=None)
+PRODUCTIONPLAN = table(
+    "productionplan",
+    column("project_id"), column("meta"), column("hierarchy"), column("product"), column("process_order"),
+    column("start_time"), column("end_time"), column("planned_quantity"),
+    column("oee_target"), column("performance_target"), column("availability_target"), column("quality_target"),
+)
+
+CANDIDATES = table(
+    "tmp_plan_candidates",
+    column("idx"), column("product"), column("hierarchy"), column("start_time"), column("end_time"),
+)
+
+# Per-row [INSERTED]/[DUPLICATE]/[SKIPPED] lines; the summary at the end is always printed
+ROW_LOG = RateLimitedLog(LOG_MAX_LINES_PER_SEC, LOG_FORMAT)
+
+def set_end_time_exclusive(start, delta):
+    return start + delta - timedelta(seconds=1)
+
+def get_base_hierarchy(hierarchy):
+    parts = hierarchy.split("$")
+    if parts and parts[-1].startswith("ast_"):
+        parts = parts[:-1]
+    return "$".join(parts)
+
+def build_candidates(grouped, product_map, base_start_time: datetime) -> Tuple[List[Dict[str, Any]], int]:
+    """Expand data_guide rows into candidate plan intervals; returns (candidates, skipped)."""
+    # Always start weeks from the most recent Monday and months from the 1st
+    week_start = base_start_time - timedelta(days=base_start_time.weekday())
+    month_start = base_start_time.replace(day=1)
+    candidates = []
+    skipped = 0
+    for base_hier, rows in grouped.items():
+        start_time = base_start_time
+        for _, row in rows:
+            name = str(row.get("name", "")).strip()
+            hierarchy = str(row.get("hierarchy", "")).strip()
+            planned_quantity = row.get("planned_quantity")
+            duration_hrs = row.get("Duration_hrs")
+            duration_type = str(row.get("type", "")).strip().lower()
+            if name not in product_map:
+                ROW_LOG.event('plan_skipped', f"[SKIPPED] Product '{name}' not found in product table.",
+                              product=name, hierarchy=hierarchy, reason='unknown_product')
+                skipped += 1
+                continue
+            if duration_type == "week":
+                intervals = [
+                    (week_start, week_start + timedelta(days=2) - timedelta(seconds=1)),
+                    (week_start + timedelta(days=2), week_start + timedelta(days=4) - timedelta(seconds=1)),
+                    (week_start + timedelta(days=4), week_start + timedelta(days=6) - timedelta(seconds=1)),
+                ]
+            elif duration_type == "month":
+                intervals = [(month_start, set_end_time_exclusive(month_start, timedelta(hours=float(duration_hrs))))]
+            elif duration_type == "day":
+                intervals = [(base_start_time, set_end_time_exclusive(base_start_time, timedelta(hours=float(duration_hrs))))]
+            else:
+                # hour, and fallback: treat as hours chained after the previous row of this base hierarchy
+                current_end = set_end_time_exclusive(start_time, timedelta(hours=float(duration_hrs)))
+                intervals = [(start_time, current_end)]
+                start_time = current_end + timedelta(seconds=1)
+            for current_start, current_end in intervals:
+                candidates.append({
+                    "name": name,
+                    "type": duration_type,
+                    "project_id": product_map[name]["project_id"],
+                    "hierarchy": hierarchy,
+                    "product": product_map[name]["id"],
+                    "start_time": current_start,
+                    "end_time": current_end,
+                    "planned_quantity": planned_quantity,
+                })
+    return candidates, skipped
+
+def find_overlapping(connection, candidates: List[Dict[str, Any]]) -> set:
+    """Positions of candidates overlapping an existing plan, checked with one set-based query.
+
+    The candidates table lives until the import's commit or rollback on Postgres (ON COMMIT DROP),
+    so a failed query is reported as is instead of by a DROP in an aborted transaction.
+    """
+    if not candidates:
+        return set()
+    if connection.dialect.name == 'postgresql':
+        on_commit = "ON COMMIT DROP"
+    else:
+        # No ON COMMIT DROP here (SQLite): clear a leftover from an earlier import on this pooled connection
+        connection.execute(text("DROP TABLE IF EXISTS temp.tmp_plan_candidates"))
+        on_commit = ""
+    connection.execute(text(f"""
+        CREATE TEMPORARY TABLE tmp_plan_candidates (
+            idx INTEGER, product INTEGER, hierarchy TEXT, start_time TIMESTAMP, end_time TIMESTAMP
+        ) {on_commit}
+    """))
+    connection.execute(insert(CANDIDATES), [
+        {"idx": pos, "product": c["product"], "hierarchy": c["hierarchy"],
+         "start_time": c["start_time"], "end_time": c["end_time"]}
+        for pos, c in enumerate(candidates)
+    ])
+    result = connection.execute(text("""
+        SELECT DISTINCT c.idx
+        FROM tmp_plan_candidates c
+        JOIN productionplan pp
+          ON pp.product = c.product AND pp.hierarchy = c.hierarchy
+         AND pp.end_time >= c.start_time AND pp.start_time <= c.end_time
+    """))
+    return {row[0] for row in result}
+
+def describe(candidate: Dict[str, Any]) -> str:
+    return f"{candidate['name']} (hierarchy: {candidate['hierarchy']})"
+
+def row_fields(candidate: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields of a candidate's structured log record."""
+    return {"product": candidate["name"], "hierarchy": candidate["hierarchy"], "type": candidate["type"],
+            "start": candidate["start_time"], "end": candidate["end_time"]}
+
+def import_productionplan(engine=None, xls: Optional[Dict[str, pd.DataFrame]] = None):
+    """Import the data_guide sheet as production plans; engine and xls default to DB_URL and the workbook.
+
+    The default engine is the pool shared with the simulator, so a daily import in the same
+    process reuses its connections instead of opening a new engine every run.
+    """
+    engine = engine if engine is not None else get_engine()
+    if not health_check(engine):
+        raise ConnectionError("Production plan import aborted: database is not reachable.")
+    with engine.connect() as connection:
+        import_with_connection(connection, xls)
+
+def import_with_connection(connection, xls: Optional[Dict[str, pd.DataFrame]] = None):
+    with IMPORTER_PHASE_SECONDS.labels('read_workbook').time():
+        xls = xls if xls is not None else load_workbook(EXCEL_FILE_PATH)
     df_plan = xls.get(SHEET_DATA_GUIDE, pd.DataFrame())
-    product_df = pd.read_sql("SELECT id, name, project_id FROM product", connection)
+    with IMPORTER_PHASE_SECONDS.labels('load_products').time():
+        product_df = pd.read_sql("SELECT id, name, project_id FROM product", connection)
     product_map = {row["name"].strip(): {"id": row["id"], "project_id": row["project_id"]} for _, row in product_df.iterrows()}
     process_order_id = connection.execute(text("SELECT id FROM processorder LIMIT 1")).scalar()
     if not process_order_id:
         raise ValueError("No process_order found in the table!")
-    def set_end_time_exclusive(start, delta):
-        return start + delta - timedelta(seconds=1)
-    def get_base_hierarchy(hierarchy):
-        parts = hierarchy.split("$")
-        if parts and parts[-1].startswith("ast_"):
-            parts = parts[:-1]
-        return "$".join(parts)
     grouped = {}
     for idx, row in df_plan.iterrows():
         name = str(row.get("name", "")).strip()
@@ -33,163 +153,53 @@ def import_productionplan():
     base_start_time = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     inserted = 0
     duplicates = 0
-    skipped = 0
     try:
-        for base_hier, rows in grouped.items():
-            start_time = base_start_time
-            for idx, row in rows:
-                name = str(row.get("name", "")).strip()
-                hierarchy = str(row.get("hierarchy", "")).strip()
-                planned_quantity = row.get("planned_quantity")
-                duration_hrs = row.get("Duration_hrs")
-                duration_type = str(row.get("type", "")).strip().lower()
-                if name not in product_map:
-                    print(f"[SKIPPED] Product '{name}' not found in product table.")
-                    skipped += 1
-                    continue
-                product_id = product_map[name]["id"]
-                project_id = product_map[name]["project_id"]
-                # Special handling for week
-                if duration_type == "week":
-                    # Always start from the most recent Monday
-                    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-                    week_start = today - timedelta(days=today.weekday())
-                    plan_intervals = [
-                        (week_start, week_start + timedelta(days=2) - timedelta(seconds=1)),
-                        (week_start + timedelta(days=2), week_start + timedelta(days=4) - timedelta(seconds=1)),
-                        (week_start + timedelta(days=4), week_start + timedelta(days=6) - timedelta(seconds=1)),
-                    ]
-                    for current_start, current_end in plan_intervals:
-                        exists = connection.execute(text("""
-                            SELECT 1 FROM productionplan
-                            WHERE product = :pid AND hierarchy = :hier
-                            AND end_time >= :start_time AND start_time <= :end_time
-                        """), {'pid': product_id, 'hier': hierarchy, 'start_time': current_start, 'end_time': current_end}).fetchone()
-                        if exists:
-                            print(f"[OVERLAP] {name} (hierarchy: {hierarchy}) overlaps existing plan in {current_start} to {current_end}. Skipping insert.")
-                            duplicates += 1
-                            continue
-                        try:
-                            connection.execute(text("""
-                                INSERT INTO productionplan (
-                                    project_id, meta, hierarchy, product, process_order,
-                                    start_time, end_time, planned_quantity,
-                                    oee_target, performance_target,
-                                    availability_target, quality_target
-                                ) VALUES (
-                                    :project_id, NULL, :hierarchy, :product, :process_order,
-                                    :start_time, :end_time, :planned_quantity,
-                                    100, 100, 100, 100
-                                )
-                            """), {
-                                "project_id": project_id,
-                                "hierarchy": hierarchy,
-                                "product": product_id,
-                                "process_order": process_order_id,
-                                "start_time": current_start,
-                                "end_time": current_end,
-                                "planned_quantity": planned_quantity,
-                            })
-                            print(f"[INSERTED] {name} (hierarchy: {hierarchy}) week interval from {current_start} to {current_end}")
-                            inserted += 1
-                        except Exception as e:
-                            print(f"[ERROR] {name} at row {idx}: {e}")
-                            skipped += 1
-                    continue
-                # Special handling for month
-                elif duration_type == "month":
-                    start_time = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                    duration = timedelta(hours=float(duration_hrs))
-                    current_start = start_time
-                    current_end = set_end_time_exclusive(current_start, duration)
-                    exists = connection.execute(text("""
-                        SELECT 1 FROM productionplan
-                        WHERE product = :pid AND hierarchy = :hier
-                        AND end_time >= :start_time AND start_time <= :end_time
-                    """), {'pid': product_id, 'hier': hierarchy, 'start_time': current_start, 'end_time': current_end}).fetchone()
-                    if exists:
-                        print(f"[DUPLICATE] {name} (hierarchy: {hierarchy}) already exists for month period.")
-                        duplicates += 1
-                        continue
-                    try:
-                        connection.execute(text("""
-                            INSERT INTO productionplan (
-                                project_id, meta, hierarchy, product, process_order,
-                                start_time, end_time, planned_quantity,
-                                oee_target, performance_target,
-                                availability_target, quality_target
-                            ) VALUES (
-                                :project_id, NULL, :hierarchy, :product, :process_order,
-                                :start_time, :end_time, :planned_quantity,
-                                100, 100, 100, 100
-                            )
-                        """), {
-                            "project_id": project_id,
-                            "hierarchy": hierarchy,
-                            "product": product_id,
-                            "process_order": process_order_id,
-                            "start_time": current_start,
-                            "end_time": current_end,
-                            "planned_quantity": planned_quantity,
-                        })
-                        print(f"[INSERTED] {name} (hierarchy: {hierarchy}) month from {current_start} to {current_end}")
-                        inserted += 1
-                    except Exception as e:
-                        print(f"[ERROR] {name} at row {idx}: {e}")
-                        skipped += 1
-                    continue
-                # Default: hour/day
+        with IMPORTER_PHASE_SECONDS.labels('build_candidates').time():
+            candidates, skipped = build_candidates(grouped, product_map, base_start_time)
+        with IMPORTER_PHASE_SECONDS.labels('find_overlapping').time():
+            overlapping = find_overlapping(connection, candidates)
+        accepted: Dict[tuple, List[tuple]] = {}  # (product, hierarchy) -> intervals accepted in this run
+        rows = []
+        inserted_candidates = []
+        for pos, candidate in enumerate(candidates):
+            key = (candidate["product"], candidate["hierarchy"])
+            interval = (candidate["start_time"], candidate["end_time"])
+            in_batch = any(end >= interval[0] and start <= interval[1] for start, end in accepted.get(key, []))
+            if pos in overlapping or in_batch:
+                if candidate["type"] == "week":
+                    message = f"[OVERLAP] {describe(candidate)} overlaps existing plan in {interval[0]} to {interval[1]}. Skipping insert."
+                elif candidate["type"] == "month":
+                    message = f"[DUPLICATE] {describe(candidate)} already exists for month period."
                 else:
-                    if duration_type == "hour":
-                        duration = timedelta(hours=float(duration_hrs))
-                        current_start = start_time
-                        current_end = set_end_time_exclusive(current_start, duration)
-                        start_time = current_end + timedelta(seconds=1)
-                    elif duration_type == "day":
-                        duration = timedelta(hours=float(duration_hrs))
-                        current_start = base_start_time
-                        current_end = set_end_time_exclusive(current_start, duration)
-                    else:
-                        # fallback: treat as hours
-                        duration = timedelta(hours=float(duration_hrs))
-                        current_start = start_time
-                        current_end = set_end_time_exclusive(current_start, duration)
-                        start_time = current_end + timedelta(seconds=1)
-                    exists = connection.execute(text("""
-                        SELECT 1 FROM productionplan
-                        WHERE product = :pid AND hierarchy = :hier
-                        AND end_time >= :start_time AND start_time <= :end_time
-                    """), {'pid': product_id, 'hier': hierarchy, 'start_time': current_start, 'end_time': current_end}).fetchone()
-                    if exists:
-                        print(f"[DUPLICATE] {name} (hierarchy: {hierarchy}) already exists.")
-                        duplicates += 1
-                    else:
-                        try:
-                            connection.execute(text("""
-                                INSERT INTO productionplan (
-                                    project_id, meta, hierarchy, product, process_order,
-                                    start_time, end_time, planned_quantity,
-                                    oee_target, performance_target,
-                                    availability_target, quality_target
-                                ) VALUES (
-                                    :project_id, NULL, :hierarchy, :product, :process_order,
-                                    :start_time, :end_time, :planned_quantity,
-                                    100, 100, 100, 100
-                                )
-                            """), {
-                                "project_id": project_id,
-                                "hierarchy": hierarchy,
-                                "product": product_id,
-                                "process_order": process_order_id,
-                                "start_time": current_start,
-                                "end_time": current_end,
-                                "planned_quantity": planned_quantity,
-                            })
-                            print(f"[INSERTED] {name} (hierarchy: {hierarchy}) from {current_start} to {current_end}")
-                            inserted += 1
-                        except Exception as e:
-                            print(f"[ERROR] {name} at row {idx}: {e}")
-                            skipped += 1
+                    message = f"[DUPLICATE] {describe(candidate)} already exists."
+                ROW_LOG.event('plan_overlap' if candidate["type"] == "week" else 'plan_duplicate', message,
+                              **row_fields(candidate))
+                duplicates += 1
+                continue
+            accepted.setdefault(key, []).append(interval)
+            inserted_candidates.append(candidate)
+            rows.append({
+                "project_id": candidate["project_id"],
+                "meta": None,
+                "hierarchy": candidate["hierarchy"],
+                "product": candidate["product"],
+                "process_order": process_order_id,
+                "start_time": interval[0],
+                "end_time": interval[1],
+                "planned_quantity": candidate["planned_quantity"],
+                "oee_target": 100,
+                "performance_target": 100,
+                "availability_target": 100,
+                "quality_target": 100,
+            })
+        if rows:
+            with IMPORTER_PHASE_SECONDS.labels('insert').time():
+                connection.execute(insert(PRODUCTIONPLAN), rows)
+        inserted = len(rows)
+        for candidate in inserted_candidates:
+            label = {"week": " week interval", "month": " month"}.get(candidate["type"], "")
+            ROW_LOG.event('plan_inserted', f"[INSERTED] {describe(candidate)}{label} from {candidate['start_time']} "
+                          f"to {candidate['end_time']}", **row_fields(candidate))
 
     except Exception as e:
         connection.rollback()
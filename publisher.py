@@ -0,0 +1,85 @@
+import json
+import time
+from typing import Dict, Any, Optional, Tuple
+from config import LOG_MAX_LINES_PER_SEC, LOG_FORMAT
+from sinks import Sink
+from metrics import PUBLISH_SECONDS, RateLimitedLog
+
+# One line per flush, which is every MQTT_BATCH_FLUSH_INTERVAL
+FLUSH_LOG = RateLimitedLog(LOG_MAX_LINES_PER_SEC, LOG_FORMAT)
+
+class MessageBatcher:
+    """Coalesce data dicts of hierarchies sharing a project/site into one message on the sink."""
+
+    # Size of the envelope around "data" with empty data, generous enough for long ids.
+    ENVELOPE_OVERHEAD = 256
+
+    def __init__(self, sink: Sink, max_payload_bytes: int = 262144, flush_interval: float = 1.0):
+        self.sink = sink
+        self.max_payload_bytes = max_payload_bytes
+        self.flush_interval = flush_interval
+        self._groups: Dict[Tuple[Any, str], Dict[str, Any]] = {}  # (project_id, site_id) -> merged data
+        self._sizes: Dict[Tuple[Any, str], int] = {}  # (project_id, site_id) -> encoded size of data
+        self._timestamps: Dict[Tuple[Any, str], float] = {}  # (project_id, site_id) -> latest timestamp
+        self._pending = 0
+        self._messages = 0
+        self.last_flush = time.time()
+
+    @staticmethod
+    def _item_size(key: str, value: Any) -> int:
+        # '"key": value, ' as produced by json.dumps with the default separators;
+        # an upper bound for the compact and binary serializers
+        return len(json.dumps(key)) + len(json.dumps(value)) + 4
+
+    def add(self, data: Dict[str, Any], timestamp: float, project_id: Any, site_id: str):
+        """Queue one hierarchy's data for the next flush of its project/site group."""
+        group = (project_id, site_id)
+        merged = self._groups.get(group)
+        size = sum(self._item_size(k, v) for k, v in data.items())
+        if merged is not None and self._sizes[group] + size + self.ENVELOPE_OVERHEAD > self.max_payload_bytes:
+            self._flush_group(group)
+            merged = None
+        if merged is None:
+            merged = self._groups[group] = {}
+            self._sizes[group] = 0
+        for key, value in data.items():
+            if key in merged:
+                self._sizes[group] -= self._item_size(key, merged[key])
+            merged[key] = value
+        self._sizes[group] += size
+        self._timestamps[group] = timestamp
+        self._pending += 1
+
+    def _flush_group(self, group: Tuple[Any, str]):
+        project_id, site_id = group
+        data = self._groups.pop(group)
+        del self._sizes[group]
+        timestamp = self._timestamps.pop(group)
+        send_start = time.perf_counter()
+        self.sink.send(data, timestamp, project_id, site_id)
+        PUBLISH_SECONDS.observe(time.perf_counter() - send_start)
+        self._messages += 1
+
+    def next_flush(self) -> float:
+        """Epoch seconds at which pending updates should be flushed (inf when empty)."""
+        return self.last_flush + self.flush_interval if self._pending else float('inf')
+
+    def flush_due(self, now_ts: float) -> int:
+        """Flush if the flush interval has elapsed, returning the number of messages sent."""
+        if self._pending and now_ts >= self.next_flush():
+            return self.flush(now_ts)
+        return 0
+
+    def flush(self, now_ts: Optional[float] = None) -> int:
+        """Publish one message per pending project/site group."""
+        groups = list(self._groups)
+        for group in groups:
+            self._flush_group(group)
+        if groups:
+            FLUSH_LOG.event('batch_flush', f"📦 Batched {self._pending} updates into {self._messages} messages",
+                            updates=self._pending, messages=self._messages)
+        sent = self._messages
+        self._pending = 0
+        self._messages = 0
+        self.last_flush = time.time() if now_ts is None else now_ts
+        return sent
@@ -0,0 +1,66 @@
+import argparse
+import json
+import time
+from typing import Dict, Any, Iterator, Tuple
+from sinks import Sink, MQTTSink, pq
+from config import MQTT_TOPIC, MQTT_SERIALIZER
+from data_simulation import create_mqtt_client
+from serializers import EnvelopeTemplate, get_serializer
+
+def read_recording(path: str) -> Iterator[Tuple[Dict[str, Any], float, Any, str]]:
+    """Yield (data, timestamp, project_id, site_id) from an NDJSON or Parquet recording."""
+    if path.endswith('.parquet'):
+        if pq is None:
+            raise ValueError("Reading parquet recordings needs the pyarrow package, which is not installed.")
+        for batch in pq.ParquetFile(path).iter_batches():
+            columns = batch.to_pydict()
+            for ts, site_id, project_id, data in zip(columns["timestamp"], columns["site_id"],
+                                                     columns["p_id"], columns["data"]):
+                yield json.loads(data), ts / 1000, json.loads(project_id), site_id
+        return
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                message = json.loads(line)
+                yield message["data"], message["timestamp"] / 1000, message["p_id"], message["site_id"]
+
+def replay(path: str, sink: Sink, speed: float = 1.0) -> int:
+    """Stream a recording into sink keeping its original spacing divided by speed (0: no waiting).
+
+    Messages keep their recorded timestamps. Returns the number of messages sent.
+    """
+    sent = 0
+    first_ts = None
+    real_start = time.monotonic()
+    for data, timestamp, project_id, site_id in read_recording(path):
+        if first_ts is None:
+            first_ts = timestamp
+        if speed > 0:
+            delay = real_start + (timestamp - first_ts) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        sink.send(data, timestamp, project_id, site_id)
+        sent += 1
+    sink.flush()
+    return sent
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded NDJSON or Parquet file to MQTT.")
+    parser.add_argument('path', help="recording written by the ndjson or parquet sink")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="replay rate relative to the recording, 0 sends as fast as the transport allows")
+    args = parser.parse_args()
+    render = EnvelopeTemplate(get_serializer(MQTT_SERIALIZER)).render
+    print(f"🚀 Replaying {args.path} at {f'{args.speed}x' if args.speed > 0 else 'full'} speed...")
+    start = time.time()
+    try:
+        with create_mqtt_client().connection() as client:
+            sent = replay(args.path, MQTTSink(client, MQTT_TOPIC, render), args.speed)
+    except KeyboardInterrupt:
+        print("🛑 User stopped.")
+        return
+    elapsed = time.time() - start
+    print(f"✅ Replayed {sent} messages in {elapsed:.1f}s ({sent / max(elapsed, 1e-9):,.0f} msg/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import json
+import time
+from typing import Dict, Any, Callable, List
+
+try:
+    import orjson
+except ImportError:  # optional fast JSON backend
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional binary backend
+    msgpack = None
+
+# Placeholders for the envelope fields that change per message; everything else is pre-encoded.
+DATA, SITE_ID, P_ID, TIMESTAMP = object(), object(), object(), object()
+
+# Same field order and constants as DataSimulator.form_message.
+ENVELOPE_FIELDS = [
+    ("data", DATA),
+    ("site_id", SITE_ID),
+    ("gw_id", ""),
+    ("pd_id", ""),
+    ("p_id", P_ID),
+    ("timestamp", TIMESTAMP),
+    ("msg_id", 1),
+    ("retain_flag", False),
+]
+
+class Serializer:
+    """Encodes values to bytes and describes how a map is laid out on the wire."""
+    name = ''
+    map_open = b''
+    key_sep = b''
+    item_sep = b''
+    map_close = b''
+
+    def dumps(self, obj: Any) -> bytes:
+        raise NotImplementedError
+
+class JSONSerializer(Serializer):
+    """stdlib json, byte-for-byte identical to json.dumps(form_message(...))."""
+    name = 'json'
+    map_open = b'{'
+    key_sep = b': '
+    item_sep = b', '
+    map_close = b'}'
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
+class OrjsonSerializer(Serializer):
+    """orjson, compact separators."""
+    name = 'orjson'
+    map_open = b'{'
+    key_sep = b':'
+    item_sep = b','
+    map_close = b'}'
+
+    def __init__(self):
+        if orjson is None:
+            raise ValueError("MQTT_SERIALIZER=orjson but the orjson package is not installed.")
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+class MsgpackSerializer(Serializer):
+    """MessagePack; a map is its header followed by the concatenated key/value pairs."""
+    name = 'msgpack'
+
+    def __init__(self):
+        if msgpack is None:
+            raise ValueError("MQTT_SERIALIZER=msgpack but the msgpack package is not installed.")
+        self.map_open = msgpack.packb({k: None for k, _ in ENVELOPE_FIELDS})[:1]
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj)
+
+SERIALIZERS = {
+    'json': JSONSerializer,
+    'orjson': OrjsonSerializer,
+    'msgpack': MsgpackSerializer,
+}
+
+def get_serializer(name: str) -> Serializer:
+    try:
+        return SERIALIZERS[name.strip().lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown serializer '{name}', expected one of {', '.join(SERIALIZERS)}")
+
+class EnvelopeTemplate:
+    """Pre-encoded form_message envelope; only data, site_id, p_id and timestamp are spliced in."""
+
+    def __init__(self, serializer: Serializer):
+        self.serializer = serializer
+        self._dumps = serializer.dumps
+        self._ids: Dict[Any, bytes] = {}  # site_id / project_id -> encoded value
+        segments: List[bytes] = []
+        chunk = serializer.map_open
+        for i, (key, value) in enumerate(ENVELOPE_FIELDS):
+            if i:
+                chunk += serializer.item_sep
+            chunk += serializer.dumps(key) + serializer.key_sep
+            if value in (DATA, SITE_ID, P_ID, TIMESTAMP):
+                segments.append(chunk)
+                chunk = b''
+            else:
+                chunk += serializer.dumps(value)
+        segments.append(chunk + serializer.map_close)
+        self._head, self._site, self._pid, self._ts, self._tail = segments
+
+    def _encode_id(self, value: Any) -> bytes:
+        encoded = self._ids.get(value)
+        if encoded is None:
+            encoded = self._ids[value] = self._dumps(value)
+        return encoded
+
+    def render(self, data: Dict[str, Any], timestamp: float, project_id: Any, site_id: str) -> bytes:
+        """Encode the envelope of form_message(data, timestamp, project_id, site_id)."""
+        return b''.join((
+            self._head, self._dumps(data),
+            self._site, self._encode_id(site_id),
+            self._pid, self._encode_id(project_id),
+            self._ts, self._dumps(int(timestamp * 1000)),
+            self._tail,
+        ))
+
+def _bench(label: str, render: Callable[[int], Any], n: int):
+    start = time.perf_counter()
+    for i in range(n):
+        render(i)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {n / elapsed:>12,.0f} msg/s")
+
+def benchmark(n: int = 200000):
+    """Print messages/sec for the legacy dict+json.dumps path and each available backend."""
+    from data_simulation import DataSimulator
+    hierarchy = "l1_100$l2_101$l3_102$l4_103$l5_104$l6_105$l7_106$ast_107"
+    site_id = hierarchy.split("$")[0]
+    now = time.time()
+
+    def data(i):
+        return {f"{hierarchy}$tag_101": i, f"{hierarchy}$tag_101_hierarchy": hierarchy}
+
+    print(f"Envelope serialization, {n:,} messages:")
+    _bench("form_message + json.dumps",
+           lambda i: json.dumps(DataSimulator.form_message(data(i), now, "project_827", site_id)), n)
+    for name in SERIALIZERS:
+        try:
+            template = EnvelopeTemplate(get_serializer(name))
+        except ValueError as e:
+            print(f"  {name:<28} skipped ({e})")
+            continue
+        _bench(f"{name} template", lambda i: template.render(data(i), now, "project_827", site_id), n)
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,176 @@
+import json
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import text, table, column, insert
+from db import get_engine
+from mqtt_transport import MQTTClientPool
+from serializers import EnvelopeTemplate, get_serializer
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed for the parquet sink and replaying parquet files
+    pa = pq = None
+
+class Sink:
+    """Destination of simulated updates; send() takes the parts of the form_message envelope."""
+    name = ''
+    buffered = False  # holds sent messages until flush(), which the simulator then calls periodically
+
+    def send(self, data: Dict[str, Any], timestamp: float, project_id: Any, site_id: str):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    @contextmanager
+    def connection(self):
+        """Open the sink for the simulation loop, flushing and closing it on exit."""
+        yield self
+
+class MQTTSink(Sink):
+    """Publish each envelope to the broker (or the pool connection of its site)."""
+    name = 'mqtt'
+
+    def __init__(self, client, topic: str, render):
+        self.client = client
+        self.topic = topic
+        self.render = render
+
+    def send(self, data: Dict[str, Any], timestamp: float, project_id: Any, site_id: str):
+        client = self.client.client_for(site_id) if isinstance(self.client, MQTTClientPool) else self.client
+        client.publish(self.topic, self.render(data, timestamp, project_id, site_id))
+
+class NDJSONSink(Sink):
+    """Append form_message envelopes as JSON lines through a large write buffer."""
+    name = 'ndjson'
+    buffered = True
+
+    def __init__(self, path: str, buffer_size: int = 1 << 20, serializer: str = 'json'):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.render = EnvelopeTemplate(get_serializer(serializer)).render
+        self.written = 0
+        self._file = None
+
+    def send(self, data: Dict[str, Any], timestamp: float, project_id: Any, site_id: str):
+        self._file.write(self.render(data, timestamp, project_id, site_id) + b'\n')
+        self.written += 1
+
+    def flush(self):
+        self._file.flush()
+
+    @contextmanager
+    def connection(self):
+        self._file = open(self.path, 'ab', buffering=self.buffer_size)
+        try:
+            yield self
+        finally:
+            self._file.close()
+            print(f"[INFO] Wrote {self.written} messages to {self.path}")
+
+class ParquetSink(Sink):
+    """Write form_message envelopes to Parquet, one row group per row_group_size messages.
+
+    data is stored as a JSON string since its keys differ per hierarchy, and p_id as JSON too
+    so replays keep integer and string project ids apart.
+    """
+    name = 'parquet'
+    buffered = True
+
+    def __init__(self, path: str, row_group_size: int = 65536):
+        if pq is None:
+            raise ValueError("Parquet sink needs the pyarrow package, which is not installed.")
+        self.path = path
+        self.row_group_size = row_group_size
+        self.schema = pa.schema([
+            ("timestamp", pa.int64()),
+            ("site_id", pa.string()),
+            ("p_id", pa.string()),
+            ("data", pa.string()),
+        ])
+        self.written = 0
+        self._writer = None
+        self._rows: Tuple[List[int], List[str], List[str], List[str]] = ([], [], [], [])
+
+    def send(self, data: Dict[str, Any], timestamp: float, project_id: Any, site_id: str):
+        timestamps, site_ids, project_ids, payloads = self._rows
+        timestamps.append(int(timestamp * 1000))
+        site_ids.append(site_id)
+        project_ids.append(json.dumps(project_id))
+        payloads.append(json.dumps(data))
+        if len(timestamps) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self._rows[0]:
+            return
+        self._writer.write_table(pa.Table.from_arrays([pa.array(col) for col in self._rows], schema=self.schema))
+        self.written += len(self._rows[0])
+        self._rows = ([], [], [], [])
+
+    @contextmanager
+    def connection(self):
+        self._writer = pq.ParquetWriter(self.path, self.schema)
+        try:
+            yield self
+        finally:
+            self.flush()
+            self._writer.close()
+            print(f"[INFO] Wrote {self.written} messages to {self.path}")
+
+class DatabaseSink(Sink):
+    """Insert rendered envelopes into a table, batch_size rows per executemany."""
+    name = 'db'
+    buffered = True
+
+    def __init__(self, db_url: str, table_name: str = 'simulated_message', batch_size: int = 1000):
+        self.engine = get_engine(db_url)
+        self.table_name = table_name
+        self.table = table(table_name, column("timestamp"), column("site_id"), column("payload"))
+        self.batch_size = batch_size
+        self.render = EnvelopeTemplate(get_serializer('json')).render
+        self.written = 0
+        self._conn = None
+        self._rows: List[dict] = []
+
+    def send(self, data: Dict[str, Any], timestamp: float, project_id: Any, site_id: str):
+        self._rows.append({"timestamp": int(timestamp * 1000), "site_id": site_id,
+                           "payload": self.render(data, timestamp, project_id, site_id).decode()})
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            self._conn.execute(insert(self.table), self._rows)
+            self._conn.commit()
+            self.written += len(self._rows)
+            self._rows = []
+
+    @contextmanager
+    def connection(self):
+        self._conn = self.engine.connect()
+        try:
+            self._conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {self.table_name} (timestamp BIGINT, site_id TEXT, payload TEXT)"
+            ))
+            self._conn.commit()
+            yield self
+            self.flush()
+            print(f"[INFO] Inserted {self.written} messages into {self.table_name}")
+        finally:
+            self._conn.close()
+
+def create_file_sink(kind: str, path: Optional[str], db_url: Optional[str] = None) -> Sink:
+    """Build a non-MQTT sink by name: ndjson, parquet or db (path is the table name for db)."""
+    if kind == 'db':
+        if not db_url:
+            raise ValueError("The db sink needs a database URL")
+        return DatabaseSink(db_url, path or 'simulated_message')
+    if not path:
+        raise ValueError(f"The {kind} sink needs a file path")
+    if kind == 'ndjson':
+        return NDJSONSink(path)
+    if kind == 'parquet':
+        return ParquetSink(path)
+    raise ValueError(f"Unknown sink '{kind}', expected mqtt, ndjson, parquet or db")
@@ -0,0 +1,189 @@
+from config import (EXCEL_FILE_PATH, DB_URL, MQTT_BATCH_ENABLED, SIMULATION_MODE, SIMULATION_WORKERS,
+                    GUIDE_RELOAD_INTERVAL, SIMULATION_SINK, SIMULATION_SINK_PATH, METRICS_PORT, METRICS_HOST,
+                    MODEL_SEED)
+import multiprocessing as mp
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+from data_simulation import DataSimulator, ProductionScheduler, create_output, SHUTDOWN, on_shutdown
+from batch_engine import BatchTickEngine
+from mqtt_transport import MQTTClientPool
+from metrics import start_metrics_server
+from db import Backoff
+from production_model import worker_seed
+
+WAKE = 'wake'
+
+def worker_sink_path(index: int) -> str:
+    """File sinks get one file per worker (out.ndjson -> out-1.ndjson); db sinks share the table."""
+    if SIMULATION_SINK not in ('ndjson', 'parquet') or not SIMULATION_SINK_PATH:
+        return SIMULATION_SINK_PATH
+    path = Path(SIMULATION_SINK_PATH)
+    return str(path.with_name(f"{path.stem}-{index}{path.suffix}"))
+
+def simulation_worker(index: int, plan_queue: mp.Queue, excel_path: str, generation: int = 0):
+    """Simulate the plans pushed on plan_queue with this process's own simulator and MQTT connection.
+
+    None on the queue stops the worker, a list replaces its plans and WAKE only wakes it
+    (the data_guide watcher uses it to get a reloaded guide applied). generation counts
+    restarts of this index and selects its random stream.
+    """
+    print(f"🚀 Simulation worker {index} started")
+    simulator = None
+    try:
+        mqtt_client = create_output(path=worker_sink_path(index))
+        simulator = DataSimulator(excel_path, None, model_seed=worker_seed(MODEL_SEED, index, generation))
+        if METRICS_PORT:
+            start_metrics_server(METRICS_PORT + 1 + index, METRICS_HOST)
+        engine = BatchTickEngine(simulator) if SIMULATION_MODE == 'batch' else None
+        scheduler = ProductionScheduler()
+
+        with mqtt_client.connection() as client:
+            simulator.sink_for(client)
+            if MQTT_BATCH_ENABLED:
+                simulator.enable_batching(client)
+            if GUIDE_RELOAD_INTERVAL > 0:
+                simulator.wake = lambda: plan_queue.put(WAKE)
+                simulator.start_guide_watch(GUIDE_RELOAD_INTERVAL)
+            deadline = None
+            while True:
+                timeout = None if deadline is None else max(0.0, (deadline - datetime.now()).total_seconds())
+                try:
+                    plans = plan_queue.get(timeout=timeout)
+                except queue.Empty:
+                    plans = False
+                if plans is None:
+                    break
+                now = datetime.now()
+                if isinstance(plans, list):
+                    simulator.apply_active_plans(plans, now)
+                    if engine is not None:
+                        engine.load_plans()
+                    else:
+                        scheduler.sync_plans(simulator, now)
+                changed = simulator.apply_pending_guide()
+                if changed:
+                    if engine is not None:
+                        engine.load_plans()
+                    else:
+                        scheduler.reschedule(simulator, changed, now)
+                if engine is not None:
+                    deadline = engine.dispatch(client, now)
+                else:
+                    deadline = scheduler.dispatch(simulator, client, now)
+            if simulator.batcher is not None:
+                simulator.batcher.flush()
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if simulator is not None:
+            simulator.close()
+        print(f"🔌 Simulation worker {index} stopped.")
+
+class SimulationSupervisor:
+    """Partition active plans by site across worker processes, refresh them and restart crashed workers."""
+
+    def __init__(self, workers: int, excel_path: str, db_url: str):
+        self.workers = workers
+        self.excel_path = excel_path
+        # Only used for its plan refresh (full/incremental/LISTEN); workers publish and own the checkpoints
+        self.plans = DataSimulator(excel_path, db_url, checkpoint_path=None)
+        self.wake = threading.Event()
+        self.plans.wake = self.wake.set
+        self.ctx = mp.get_context('spawn')
+        self.processes: List[Optional[mp.Process]] = [None] * workers
+        self.queues: List[Optional[mp.Queue]] = [None] * workers
+        self.assigned: List[List[dict]] = [[] for _ in range(workers)]  # plans last sent to each worker
+        self.health_check_interval = 5.0
+        # Crashed workers are restarted after a growing delay, reset once a worker stays up for stable_after
+        self.restart_backoff = [Backoff(initial=1.0, maximum=300.0) for _ in range(workers)]
+        self.started_at = [0.0] * workers
+        self.generations = [0] * workers  # starts of each worker index, for its model seed
+        self.stable_after = 60.0
+
+    def partition(self, plans: List[dict]) -> List[List[dict]]:
+        """Split plans by site id, with the same stable hash the MQTT pool uses."""
+        parts = [[] for _ in range(self.workers)]
+        for plan in plans:
+            site_id = plan['hierarchy'].split("$")[0]
+            parts[MQTTClientPool.shard_index(site_id, self.workers)].append(plan)
+        return parts
+
+    def _start_worker(self, index: int):
+        plan_queue = self.ctx.Queue()
+        process = self.ctx.Process(target=simulation_worker,
+                                   args=(index, plan_queue, self.excel_path, self.generations[index]),
+                                   name=f"simulation-worker-{index}", daemon=True)
+        self.generations[index] += 1
+        process.start()
+        self.queues[index] = plan_queue
+        self.processes[index] = process
+        self.started_at[index] = time.time()
+        plan_queue.put(self.assigned[index])
+
+    def refresh(self):
+        if not self.plans.refresh_active_plans():
+            return  # still running or failed, keep the current assignment
+        assigned = self.partition(list(self.plans.active_plans.values()))
+        for index, plans in enumerate(assigned):
+            if [plan['id'] for plan in plans] != [plan['id'] for plan in self.assigned[index]]:
+                self.queues[index].put(plans)
+        self.assigned = assigned
+
+    def check_workers(self):
+        now_ts = time.time()
+        for index, process in enumerate(self.processes):
+            backoff = self.restart_backoff[index]
+            if process is None:
+                if backoff.ready(now_ts):
+                    print(f"[INFO] Restarting simulation worker {index}")
+                    self._start_worker(index)
+            elif not process.is_alive():
+                if now_ts - self.started_at[index] >= self.stable_after:
+                    backoff.succeeded()
+                delay = backoff.failed(now_ts)
+                print(f"[WARN] Simulation worker {index} exited with code {process.exitcode}, "
+                      f"restarting in {delay:.1f}s")
+                self.processes[index] = None
+
+    def run(self):
+        start_metrics_server(METRICS_PORT, METRICS_HOST)
+        for index in range(self.workers):
+            self._start_worker(index)
+        on_shutdown(self.wake.set)
+        try:
+            while not SHUTDOWN.is_set():
+                now = datetime.now()
+                if self.plans.refresh_due(now):
+                    self.refresh()
+                self.check_workers()
+                next_refresh = self.plans.next_refresh_at(now)
+                timeout = min(self.health_check_interval, (next_refresh - datetime.now()).total_seconds())
+                if timeout > 0:
+                    self.wake.wait(timeout)
+                self.wake.clear()
+        finally:
+            for plan_queue in self.queues:
+                plan_queue.put(None)
+            for process in self.processes:
+                if process is not None:
+                    process.join(timeout=10)
+            self.plans.close()
+
+def supervised_simulation():
+    """Run the simulation across SIMULATION_WORKERS processes."""
+    print(f"🚀 Starting supervised simulation with {SIMULATION_WORKERS} workers...")
+    try:
+        SimulationSupervisor(SIMULATION_WORKERS, EXCEL_FILE_PATH, DB_URL).run()
+    except KeyboardInterrupt:
+        print("🛑 User stopped.")
+    except Exception as e:
+        print(f"Error in supervised simulation: {e}")
+        raise
+
+if __name__ == "__main__":
+    supervised_simulation()
@@ -0,0 +1,18 @@
+import os
+import sys
+
+# config.py reads these at import time; keep the tests off the real broker, database and caches
+os.environ.update({
+    'POSTGRES_URI': 'sqlite://',
+    'MQTT_BROKER': 'localhost',
+    'MQTT_PORT': '1883',
+    'MQTT_TOPIC': 'test/',
+    'EXCEL_FILE_NAME': 'sim_data.xlsx',
+    'WORKBOOK_CACHE_DIR': '',
+    'CHECKPOINT_PATH': '',
+    'PRODUCTION_MODEL': 'fixed',
+    'PLAN_NOTIFY_CHANNEL': '',
+    'METRICS_PORT': '0',
+    'LOG_MAX_LINES_PER_SEC': '0',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
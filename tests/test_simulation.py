@@ -0,0 +1,183 @@
+import contextlib
+import threading
+from datetime import datetime, timedelta
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+import data_simulation
+from config import SHEET_DATA_GUIDE
+from data_simulation import DataSimulator, ProductionScheduler
+from batch_engine import BatchTickEngine
+from benchmark import synthetic_sheets, synthetic_plans
+from productionplan_importer import find_overlapping, import_with_connection
+
+START = datetime(2026, 1, 5, 6, 0)
+
+class RecordingClient:
+    """Stand-in for an MQTT connection that keeps every published payload."""
+
+    def __init__(self):
+        self.payloads = []
+
+    def publish(self, topic: str, payload: bytes):
+        self.payloads.append(payload)
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield self
+
+def simulate(simulator: DataSimulator, mode: str, start: datetime, duration: timedelta,
+             step: timedelta = timedelta(seconds=30), client: RecordingClient = None) -> RecordingClient:
+    """Publish with the event or batch engine at every step over duration."""
+    client = client if client is not None else RecordingClient()
+    if mode == 'batch':
+        engine = BatchTickEngine(simulator)
+        engine.load_plans()
+        tick = lambda now: engine.dispatch(client, now)
+    else:
+        scheduler = ProductionScheduler()
+        scheduler.sync_plans(simulator, start)
+        tick = lambda now: scheduler.dispatch(simulator, client, now)
+    now = start
+    while now < start + duration:
+        tick(now)
+        now += step
+    return client
+
+def create_tables(engine):
+    with engine.begin() as conn:
+        for ddl in (
+            "CREATE TABLE product (id INTEGER PRIMARY KEY, name TEXT, project_id TEXT)",
+            "CREATE TABLE processorder (id INTEGER PRIMARY KEY)",
+            "CREATE TABLE productionplan (id INTEGER PRIMARY KEY, project_id TEXT, meta TEXT, hierarchy TEXT, "
+            "product INTEGER, process_order INTEGER, start_time TIMESTAMP, end_time TIMESTAMP, "
+            "planned_quantity INTEGER, oee_target INTEGER, performance_target INTEGER, "
+            "availability_target INTEGER, quality_target INTEGER)",
+        ):
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO processorder (id) VALUES (1)"))
+
+def insert_plan(engine, plan_id: int, hierarchy: str, product: int, start: datetime, end: datetime):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO productionplan (id, project_id, hierarchy, product, process_order, "
+                          "start_time, end_time) VALUES (:id, 'project_test', :hierarchy, :product, 1, :start, :end)"),
+                     {"id": plan_id, "hierarchy": hierarchy, "product": product, "start": start, "end": end})
+
+@pytest.fixture
+def sheets():
+    return synthetic_sheets(40, products=5)
+
+def test_event_and_batch_engines_publish_the_same_updates(sheets):
+    published = {}
+    for mode in ('event', 'batch'):
+        simulator = DataSimulator('synthetic', None, checkpoint_path=None, sheets=sheets)
+        simulator.apply_active_plans(synthetic_plans(sheets, START), START)
+        published[mode] = simulate(simulator, mode, START, timedelta(hours=2)).payloads
+        simulator.close()
+    assert published['event']
+    assert sorted(published['event']) == sorted(published['batch'])
+
+def test_importer_skips_plans_overlapping_existing_ones(sheets, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    create_tables(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO product (id, name, project_id) VALUES (:id, :name, 'project_test')"),
+                     [{"id": i + 1, "name": name} for i, name in enumerate(sheets["product"]["name"])])
+    with engine.connect() as conn:
+        import_with_connection(conn, sheets)
+    with engine.connect() as conn:
+        plans = conn.execute(text("SELECT COUNT(*) FROM productionplan")).scalar()
+        import_with_connection(conn, sheets)
+    with engine.connect() as conn:
+        assert plans == len(sheets[SHEET_DATA_GUIDE])
+        assert conn.execute(text("SELECT COUNT(*) FROM productionplan")).scalar() == plans
+        existing = conn.execute(text("SELECT product, hierarchy, start_time, end_time FROM productionplan "
+                                     "ORDER BY id LIMIT 1")).one()
+        start = datetime.fromisoformat(str(existing.start_time))
+        end = datetime.fromisoformat(str(existing.end_time))
+        candidates = [
+            {"product": existing.product, "hierarchy": existing.hierarchy,
+             "start_time": end - timedelta(hours=1), "end_time": end + timedelta(hours=1)},
+            {"product": existing.product, "hierarchy": existing.hierarchy,
+             "start_time": end + timedelta(seconds=1), "end_time": end + timedelta(hours=2)},
+            {"product": existing.product + 1, "hierarchy": existing.hierarchy,
+             "start_time": start, "end_time": end},
+        ]
+        assert find_overlapping(conn, candidates) == {0}
+    engine.dispose()
+
+def test_incremental_refresh_applies_started_and_ended_plans(sheets, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_simulation, 'PLAN_REFRESH_MODE', 'incremental')
+    db_url = f"sqlite:///{tmp_path / 'plans.db'}"
+    engine = create_engine(db_url)
+    create_tables(engine)
+    guide = sheets[SHEET_DATA_GUIDE]
+    products = list(sheets["product"]["name"])
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO product (id, name, project_id) VALUES (:id, :name, 'project_test')"),
+                     [{"id": i + 1, "name": name} for i, name in enumerate(products)])
+    hierarchies = list(guide["hierarchy"][:3])
+    product_ids = [products.index(name) + 1 for name in guide["name"][:3]]
+    insert_plan(engine, 1, hierarchies[0], product_ids[0], START - timedelta(hours=1), START + timedelta(hours=1))
+    insert_plan(engine, 2, hierarchies[1], product_ids[1], START + timedelta(minutes=30), START + timedelta(hours=2))
+
+    simulator = DataSimulator('synthetic', db_url, checkpoint_path=None, sheets=sheets, background_refresh=False)
+    simulator.full_refresh_interval = timedelta(hours=6)  # no periodic reconcile in this window
+    assert simulator.refresh_active_plans(START)
+    assert set(simulator.active_plan_ids.values()) == {1}
+    assert simulator.next_plan_transition == START + timedelta(minutes=30)
+
+    # Added after the last refresh but already running: caught by its id, not a boundary
+    insert_plan(engine, 3, hierarchies[2], product_ids[2], START - timedelta(minutes=10), START + timedelta(hours=3))
+    later = START + timedelta(minutes=31)
+    assert simulator.refresh_active_plans(later)
+    assert set(simulator.active_plan_ids.values()) == {1, 2, 3}
+    assert simulator.last_full_refresh == START
+
+    ended = START + timedelta(hours=1, seconds=1)
+    assert simulator.refresh_active_plans(ended)
+    assert set(simulator.active_plan_ids.values()) == {2, 3}
+    assert simulator.last_full_refresh == START
+    simulator.close()
+    engine.dispose()
+
+def test_restart_resumes_counters_from_checkpoint(sheets, tmp_path):
+    path = tmp_path / 'checkpoints.sqlite3'
+    start = datetime.now().replace(microsecond=0)  # checkpoints of plans that ended a day ago are dropped
+    plans = synthetic_plans(sheets, start)
+    first = DataSimulator('synthetic', None, checkpoint_path=path, sheets=sheets)
+    first.apply_active_plans(plans, start)
+    simulate(first, 'event', start, timedelta(minutes=30))
+    produced = dict(first.produced_count)
+    last_produced = dict(first.last_produced_push)
+    first.close()
+    assert any(produced.values())
+
+    restarted = DataSimulator('synthetic', None, checkpoint_path=path, sheets=sheets)
+    restarted.apply_active_plans(plans, start + timedelta(minutes=30))
+    assert restarted.produced_count == produced
+    assert restarted.last_produced_push == last_produced
+    restarted.close()
+
+def test_guide_hot_reload_keeps_counters(sheets, tmp_path):
+    path = tmp_path / 'guide.xlsx'
+    with pd.ExcelWriter(path) as writer:
+        for name, sheet in sheets.items():
+            sheet.to_excel(writer, sheet_name=name, index=False)
+    simulator = DataSimulator(str(path), None, checkpoint_path=None)
+    reloaded = threading.Event()
+    simulator.wake = reloaded.set
+    simulator.apply_active_plans(synthetic_plans(sheets, START), START)
+    simulate(simulator, 'event', START, timedelta(minutes=30))
+    produced = dict(simulator.produced_count)
+
+    guide = sheets[SHEET_DATA_GUIDE].copy()
+    guide.loc[0, "frequency"] = guide.loc[0, "frequency"] + 1
+    with pd.ExcelWriter(path) as writer:
+        for name, sheet in {**sheets, SHEET_DATA_GUIDE: guide}.items():
+            sheet.to_excel(writer, sheet_name=name, index=False)
+    simulator.start_guide_watch(0.05)
+    assert reloaded.wait(10)
+    assert simulator.apply_pending_guide() == [guide.loc[0, "hierarchy"]]
+    assert simulator.produced_count == produced
+    simulator.close()
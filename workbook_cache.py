@@ -0,0 +1,114 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import pandas as pd
+from config import WORKBOOK_CACHE_DIR
+
+class CachedWorkbook:
+    __slots__ = ('stat_key', 'digest', 'sheets')
+
+    def __init__(self, stat_key: Tuple[int, int], digest: str, sheets: Dict[str, pd.DataFrame]):
+        self.stat_key = stat_key  # (mtime_ns, size) the digest was computed for
+        self.digest = digest  # sha256 of the file contents
+        self.sheets = sheets
+
+class WorkbookCache:
+    """Parsed Excel workbooks cached in memory and as pickles on disk.
+
+    A workbook is re-hashed only when its mtime or size changes, and re-parsed
+    only when the hash changes; a parse is written to cache_dir so the next
+    process start skips openpyxl entirely. Returned DataFrames are shared, so
+    callers must not modify them in place.
+    """
+
+    def __init__(self, cache_dir: Optional[Path]):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries: Dict[str, CachedWorkbook] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def stat_key(path) -> Tuple[int, int]:
+        """(mtime_ns, size) of the file, the cheap first check of whether it was edited."""
+        stat = os.stat(str(path))
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _digest(path: str) -> str:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def load(self, path) -> Dict[str, pd.DataFrame]:
+        """All sheets of the workbook at path, as pd.read_excel(path, sheet_name=None) returns them."""
+        return self.load_versioned(path)[2]
+
+    def load_versioned(self, path) -> Tuple[Tuple[int, int], str, Dict[str, pd.DataFrame]]:
+        """(stat_key, digest, sheets) of the workbook at path.
+
+        The cache is shared by every loader in the process, so callers that react to edits
+        keep the digest they last used and compare against it rather than the cache's state.
+        """
+        path = str(path)
+        with self._lock:
+            stat_key = self.stat_key(path)
+            entry = self._entries.get(path)
+            if entry is not None and entry.stat_key == stat_key:
+                return stat_key, entry.digest, entry.sheets
+            digest = self._digest(path)
+            if entry is not None and entry.digest == digest:
+                entry.stat_key = stat_key  # touched but unchanged
+                return stat_key, digest, entry.sheets
+            sheets = self._read_disk(path, digest)
+            if sheets is None:
+                sheets = pd.read_excel(path, sheet_name=None)
+                self._write_disk(path, digest, sheets)
+            self._entries[path] = CachedWorkbook(stat_key, digest, sheets)
+            return stat_key, digest, sheets
+
+    @staticmethod
+    def _disk_prefix(path: str) -> str:
+        """Stem plus a hash of the full path, so same-named workbooks never touch each other's files."""
+        path_hash = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:12]
+        return f"{Path(path).stem}-{path_hash}-"
+
+    def _disk_path(self, path: str, digest: str) -> Path:
+        return self.cache_dir / f"{self._disk_prefix(path)}{digest}.pkl"
+
+    def _read_disk(self, path: str, digest: str) -> Optional[Dict[str, pd.DataFrame]]:
+        if self.cache_dir is None:
+            return None
+        cached = self._disk_path(path, digest)
+        if not cached.exists():
+            return None
+        try:
+            return pd.read_pickle(cached)
+        except Exception as e:
+            print(f"[WARN] Ignoring unreadable workbook cache {cached}: {e}")
+            return None
+
+    def _write_disk(self, path: str, digest: str, sheets: Dict[str, pd.DataFrame]):
+        if self.cache_dir is None:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            cached = self._disk_path(path, digest)
+            tmp = cached.with_suffix(f".{os.getpid()}.tmp")
+            pd.to_pickle(sheets, tmp)
+            os.replace(tmp, cached)
+            # Drop parses of older versions of the same workbook
+            prefix = self._disk_prefix(path)
+            for stale in self.cache_dir.glob("*.pkl"):
+                if stale.name.startswith(prefix) and stale != cached:
+                    stale.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"[WARN] Could not write workbook cache for {path}: {e}")
+
+WORKBOOK_CACHE = WorkbookCache(WORKBOOK_CACHE_DIR)
+
+def load_workbook(path) -> Dict[str, pd.DataFrame]:
+    """Cached equivalent of pd.read_excel(path, sheet_name=None)."""
+    return WORKBOOK_CACHE.load(path)